@@ -0,0 +1,3 @@
+"""
+Benchmarks for the API. Run them from the repository root, e.g. python -m benchmarks.server_modes
+"""
@@ -0,0 +1,103 @@
+"""
+Seeded synthetic data. The same seed and counts always produce the same rows, so runs on
+different commits measure the same database.
+"""
+import random, datetime
+from collections import Counter
+from models import db, Role, User, Question, Answer, QuestionImages, AnswerImages
+from queries import recount_questions
+
+BASE_TIME = datetime.datetime(2021, 1, 1)
+PASSWORD = "bench"
+BATCH_SIZE = 1000
+WORDS = ("python flask sqlalchemy mysql postgres index query cache session request response "
+    "json image upload bucket thread answer question user login token cursor page search "
+    "deploy heroku gunicorn worker async pool replica latency error migration model route").split()
+
+def text(rng, min_words, max_words, max_length):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words)))[:max_length]
+
+def description(rng):
+    # most posts are a few sentences, a long tail gets close to the 5000 chars limit
+    words = min(int(rng.lognormvariate(3.5, 1.0)) + 1, 700)
+    return text(rng, words, words, 5000)
+
+def question_weights(rng, questions, skew):
+    """
+    Zipf weights in a shuffled order: a few questions get most of the answers and reads.
+    """
+    ranks = list(range(1, questions + 1))
+    rng.shuffle(ranks)
+    return [1.0 / rank ** skew for rank in ranks]
+
+def insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.bulk_insert_mappings(model, rows[start:start + BATCH_SIZE])
+    db.session.commit()
+
+def reset_sequences(*models):
+    # the rows carry explicit ids, PostgreSQL's SERIAL sequences have to be moved past them
+    # or the next insert of the app collides with a generated row
+    if db.engine.dialect.name != "postgresql":
+        return
+    for model in models:
+        table = db.engine.dialect.identifier_preparer.quote_identifier(model.__table__.name)
+        db.session.execute("SELECT setval(pg_get_serial_sequence(:table, 'id'), coalesce(max(id), 0) + 1, false) "
+            "FROM {}".format(table), {"table": table})
+    db.session.commit()
+
+def generate(seed=1, users=200, questions=2000, answers=10000, question_images=500, answer_images=1000, skew=1.1):
+    """
+    Inserts the rows into an empty database and returns what the workloads need to address them.
+    """
+    if User.query.first() is not None:
+        raise ValueError("The benchmark database must be empty")
+    rng = random.Random(seed)
+    insert(Role, [{"id": 1, "name": "Admin", "created": BASE_TIME, "last_update": BASE_TIME},
+        {"id": 2, "name": "User", "created": BASE_TIME, "last_update": BASE_TIME}])
+
+    insert(User, [{"id": i, "name": "user{}".format(i), "email": "user{}@bench.local".format(i),
+        "password": PASSWORD, "id_role": 2, "is_active": True, "alerts_activated": True,
+        "created": BASE_TIME, "last_update": BASE_TIME} for i in range(1, users + 1)])
+
+    question_created = sorted(BASE_TIME + datetime.timedelta(seconds=rng.randint(0, 365 * 86400))
+        for _ in range(questions))
+    insert(Question, [{"id": i, "id_user": rng.randint(1, users), "title": text(rng, 3, 12, 100),
+        "description": description(rng), "link": None, "created": created, "last_update": created}
+        for i, created in enumerate(question_created, 1)])
+
+    weights = question_weights(rng, questions, skew)
+    answer_questions = rng.choices(range(1, questions + 1), weights=weights, k=answers)
+    answer_rows = []
+    for i, id_question in enumerate(answer_questions, 1):
+        created = question_created[id_question - 1] + datetime.timedelta(seconds=rng.randint(60, 30 * 86400))
+        answer_rows.append({"id": i, "id_question": id_question, "id_user": rng.randint(1, users),
+            "description": description(rng), "link": None, "created": created, "last_update": created})
+    insert(Answer, answer_rows)
+
+    def image_rows(parent_column, parents, count):
+        rows = []
+        for i in range(1, count + 1):
+            width, height = rng.choice(((640, 480), (1280, 720), (1920, 1080), (800, 800)))
+            rows.append({"id": i, parent_column: rng.randint(1, parents),
+                "url": "https://bench.invalid/images/{}/{}.png".format(parent_column, i),
+                "size": rng.randint(20000, 2000000), "width": width, "height": height,
+                "created": BASE_TIME, "last_update": BASE_TIME})
+        return rows
+    if questions:
+        insert(QuestionImages, image_rows("id_question", questions, question_images))
+    if answers:
+        insert(AnswerImages, image_rows("id_answer", answers, answer_images))
+    # the rows are bulk inserted, the question counters are filled in afterwards
+    recount_questions()
+    reset_sequences(Role, User, Question, Answer, QuestionImages, AnswerImages)
+
+    return {
+        "users": users,
+        "questions": questions,
+        "answers": answers,
+        "question_images": question_images,
+        "answer_images": answer_images,
+        "question_weights": weights,
+        "max_answers_per_question": max(Counter(answer_questions).values()) if answers else 0
+    }
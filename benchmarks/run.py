@@ -0,0 +1,118 @@
+"""
+Generates the benchmark data, runs the workloads in process with the Flask test client and
+prints the results as JSON, e.g.
+
+    python -m benchmarks.run --questions 5000 --answers 25000 --output before.json
+
+--db takes any SQLAlchemy URL. A SQLite file is recreated on every run, other databases must
+be empty and migrated (pipenv run upgrade) beforehand.
+"""
+import os, sys, time, json, random, argparse, datetime, subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=SRC_DIR,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def run_workload(client, workload, context, rng, requests):
+    from query_guard import QueryGuard
+    latencies, queries, errors = [], [], 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        guard = QueryGuard(mode="off")
+        request_start = time.perf_counter()
+        with guard:
+            response = workload(client, context, rng)
+        latencies.append(time.perf_counter() - request_start)
+        queries.append(guard.count)
+        if response.status_code >= 400:
+            errors += 1
+    return latencies, queries, errors, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="sqlite:////tmp/questioner-bench.db")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--answers", type=int, default=10000)
+    parser.add_argument("--question-images", type=int, default=500)
+    parser.add_argument("--answer-images", type=int, default=1000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of answers and reads per question")
+    parser.add_argument("--workloads", default="list,thread,search,login,answer_post")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per workload")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per workload")
+    parser.add_argument("--output", help="file for the JSON results, stdout by default")
+    args = parser.parse_args()
+
+    # main reads its configuration at import time
+    os.environ['DB_CONNECTION_STRING'] = args.db
+    sys.path.insert(0, SRC_DIR)
+    if args.db.startswith("sqlite:///") and os.path.exists(args.db[len("sqlite:///"):]):
+        os.remove(args.db[len("sqlite:///"):])
+    from main import app
+    from models import db
+    from flask_jwt_extended import create_access_token
+    from benchmarks.data import generate
+    from benchmarks.workloads import WORKLOADS
+    from benchmarks.stats import latency_ms
+
+    names = args.workloads.split(",")
+    unknown = [name for name in names if name not in WORKLOADS]
+    if unknown:
+        parser.error("Unknown workloads: " + ", ".join(unknown))
+
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            db.create_all()
+        start = time.perf_counter()
+        data = generate(args.seed, args.users, args.questions, args.answers,
+            args.question_images, args.answer_images, args.skew)
+        generate_seconds = time.perf_counter() - start
+        token = create_access_token(identity=1)
+        dialect = db.engine.dialect.name
+
+    context = {
+        "headers": {"Authorization": "Bearer " + token},
+        "users": data["users"],
+        "question_ids": list(range(1, data["questions"] + 1)),
+        "question_weights": data["question_weights"]
+    }
+    client = app.test_client()
+    results = {}
+    for name in names:
+        rng = random.Random("{}:{}".format(args.seed, name))
+        run_workload(client, WORKLOADS[name], context, rng, args.warmup)
+        latencies, queries, errors, seconds = run_workload(client, WORKLOADS[name], context, rng, args.requests)
+        results[name] = {
+            "requests": args.requests,
+            "errors": errors,
+            "seconds": round(seconds, 3),
+            "throughput": round(args.requests / seconds, 1),
+            "latency_ms": latency_ms(latencies),
+            "queries_per_request": {"mean": round(sum(queries) / len(queries), 2), "max": max(queries)}
+        }
+
+    report = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(),
+        "config": dict(vars(args), dialect=dialect, db=args.db.split("@")[-1],
+            cache_backend=os.environ.get('CACHE_BACKEND', 'none'),
+            search_index=os.environ.get('SEARCH_INDEX_ENABLED', 'false')),
+        "data": dict((key, value) for key, value in data.items() if key != "question_weights"),
+        "generate_seconds": round(generate_seconds, 2),
+        "workloads": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
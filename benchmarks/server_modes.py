@@ -0,0 +1,64 @@
+"""
+Compares the throughput of running servers at high concurrency, e.g. the sync and the async mode:
+
+    gunicorn wsgi --chdir ./src/ -w 2 -b 127.0.0.1:3001
+    uvicorn asgi:application --app-dir src --workers 2 --port 3002
+    python -m benchmarks.server_modes --target sync=http://127.0.0.1:3001 \\
+        --target async=http://127.0.0.1:3002 --path /questions --token <jwt>
+
+Prints one JSON object with the results of every target.
+"""
+import time, json, argparse, urllib.request, urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.stats import latency_ms
+
+def timed_request(url, headers, timeout):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = None
+    return status, time.perf_counter() - start
+
+def load(url, headers, concurrency, requests, timeout):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: timed_request(url, headers, timeout), range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for status, latency in results if status is not None and status < 400]
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": requests - len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "latency_ms": latency_ms(latencies)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="name=base url, repeatable")
+    parser.add_argument("--path", default="/questions")
+    parser.add_argument("--token", help="JWT sent as a Bearer token")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    headers = {"Authorization": "Bearer " + args.token} if args.token else {}
+    results = {}
+    for target in args.target:
+        name, base_url = target.split("=", 1)
+        url = base_url.rstrip("/") + args.path
+        # warm up connections, caches and the search index before measuring
+        load(url, headers, min(args.concurrency, 10), min(args.requests, 50), args.timeout)
+        results[name] = load(url, headers, args.concurrency, args.requests, args.timeout)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+PERCENTILES = (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99))
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def latency_ms(latencies):
+    """
+    Latency percentiles and max in milliseconds of a list of durations in seconds.
+    """
+    result = {name: round(percentile(latencies, fraction) * 1000, 2) if latencies else None
+        for name, fraction in PERCENTILES}
+    result["max"] = round(max(latencies) * 1000, 2) if latencies else None
+    return result
@@ -0,0 +1,31 @@
+"""
+Scripted requests against the hot endpoints. Each workload sends one request with the test client.
+"""
+from benchmarks.data import WORDS, PASSWORD, text
+
+def list_questions(client, context, rng):
+    return client.get('/questions?limit=50', headers=context["headers"])
+
+def thread(client, context, rng):
+    id = rng.choices(context["question_ids"], weights=context["question_weights"])[0]
+    return client.get('/thread/{}'.format(id), headers=context["headers"])
+
+def search(client, context, rng):
+    return client.get('/search-questions-by-string/{}'.format(rng.choice(WORDS)), headers=context["headers"])
+
+def login(client, context, rng):
+    email = "user{}@bench.local".format(rng.randint(1, context["users"]))
+    return client.post('/login', json={"email": email, "password": PASSWORD})
+
+def answer_post(client, context, rng):
+    id_question = rng.choices(context["question_ids"], weights=context["question_weights"])[0]
+    return client.post('/answer', headers=context["headers"], json={"id_question": id_question,
+        "id_user": rng.randint(1, context["users"]), "description": text(rng, 20, 80, 5000), "link": None})
+
+WORKLOADS = {
+    "list": list_questions,
+    "thread": thread,
+    "search": search,
+    "login": login,
+    "answer_post": answer_post
+}
@@ -0,0 +1,56 @@
+import os, sys, datetime, tempfile
+import pytest
+
+# main reads its configuration at import time: a throwaway SQLite file, no cache or replicas
+DB_FILE = os.path.join(tempfile.mkdtemp(prefix="questioner-tests-"), "test.db")
+os.environ['DB_CONNECTION_STRING'] = 'sqlite:///' + DB_FILE
+for name in ('CACHE_BACKEND', 'DB_REPLICA_CONNECTION_STRINGS', 'SEARCH_INDEX_ENABLED', 'QUERY_GUARD'):
+    os.environ.pop(name, None)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+pytest_plugins = ["query_guard"]
+
+QUESTIONS = 10
+ANSWERS_PER_QUESTION = 5
+
+@pytest.fixture(scope="session")
+def app():
+    from main import app
+    from models import db, Role, User, Question, Answer, QuestionImages, AnswerImages
+    now = datetime.datetime.now()
+    with app.app_context():
+        db.create_all()
+        db.session.add(Role(id=2, name="User", created=now, last_update=now))
+        for i in range(1, 4):
+            db.session.add(User(id=i, name="user{}".format(i), email="user{}@test.local".format(i), password="test",
+                id_role=2, is_active=True, created=now, last_update=now))
+        answer_id = 0
+        for i in range(1, QUESTIONS + 1):
+            # in the past, answers posted by the tests are the newest
+            created = now - datetime.timedelta(seconds=QUESTIONS + 1 - i)
+            db.session.add(Question(id=i, id_user=(i % 3) + 1, title="python question {}".format(i),
+                description="flask description {}".format(i), created=created, last_update=created,
+                answer_count=ANSWERS_PER_QUESTION, image_count=1))
+            db.session.add(QuestionImages(id=i, id_question=i, url="https://test.invalid/q{}.png".format(i),
+                size=1, created=created, last_update=created))
+            for j in range(ANSWERS_PER_QUESTION):
+                answer_id += 1
+                db.session.add(Answer(id=answer_id, id_question=i, id_user=(j % 3) + 1,
+                    description="answer {}".format(answer_id), created=created, last_update=created))
+                db.session.add(AnswerImages(id=answer_id, id_answer=answer_id,
+                    url="https://test.invalid/a{}.png".format(answer_id), size=1, created=created, last_update=created))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def auth_headers(app):
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        return {"Authorization": "Bearer " + create_access_token(identity=1)}
@@ -0,0 +1,30 @@
+"""content hash on images
+
+Revision ID: 0a6c3e9f1d54
+Revises: f1b9d4c3e726
+Create Date: 2026-10-18 14:05:12.738260
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a6c3e9f1d54'
+down_revision = 'f1b9d4c3e726'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('answer_images', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_answer_images_content_hash', 'answer_images', ['content_hash'], unique=False)
+    op.add_column('question_images', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_question_images_content_hash', 'question_images', ['content_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_question_images_content_hash', table_name='question_images')
+    op.drop_column('question_images', 'content_hash')
+    op.drop_index('ix_answer_images_content_hash', table_name='answer_images')
+    op.drop_column('answer_images', 'content_hash')
@@ -0,0 +1,35 @@
+"""answer and image counters on question
+
+Revision ID: 1b7d5e2f9a30
+Revises: 0a6c3e9f1d54
+Create Date: 2026-10-18 16:20:41.512093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b7d5e2f9a30'
+down_revision = '0a6c3e9f1d54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('question', sa.Column('answer_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('question', sa.Column('last_answer_at', sa.DateTime(), nullable=True))
+    op.add_column('question', sa.Column('image_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        "UPDATE question SET "
+        "answer_count = (SELECT count(answer.id) FROM answer WHERE answer.id_question = question.id), "
+        "last_answer_at = (SELECT max(answer.created) FROM answer WHERE answer.id_question = question.id), "
+        "image_count = (SELECT count(question_images.id) FROM question_images "
+        "WHERE question_images.id_question = question.id)"
+    )
+
+
+def downgrade():
+    op.drop_column('question', 'image_count')
+    op.drop_column('question', 'last_answer_at')
+    op.drop_column('question', 'answer_count')
@@ -0,0 +1,32 @@
+"""fulltext index on question title and description
+
+Revision ID: b4d2a7c91e3f
+Revises: 93723c93ea85
+Create Date: 2026-10-18 10:12:40.512873
+
+"""
+from alembic import op
+from search import FULLTEXT_INDEX_NAME, POSTGRES_TSVECTOR_SQL
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d2a7c91e3f'
+down_revision = '93723c93ea85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the index depends on the dialect, SQLite keeps using the ILIKE search
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # the same expression postgres_search queries, or the planner can't use the index
+        op.execute("CREATE INDEX {} ON question USING gin ({})".format(FULLTEXT_INDEX_NAME, POSTGRES_TSVECTOR_SQL))
+    elif dialect == 'mysql':
+        op.execute("CREATE FULLTEXT INDEX {} ON question (title, description)".format(FULLTEXT_INDEX_NAME))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect in ('postgresql', 'mysql'):
+        op.drop_index(FULLTEXT_INDEX_NAME, table_name='question')
@@ -0,0 +1,45 @@
+"""indexes on foreign keys and pagination columns
+
+Revision ID: c7e1f0a4d582
+Revises: b4d2a7c91e3f
+Create Date: 2026-10-18 11:02:17.390114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e1f0a4d582'
+down_revision = 'b4d2a7c91e3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_user_id_role', 'user', ['id_role'], unique=False)
+    op.create_index('ix_user_created_id', 'user', ['created', 'id'], unique=False)
+    op.create_index('ix_question_id_user', 'question', ['id_user'], unique=False)
+    op.create_index('ix_question_id_answer_selected', 'question', ['id_answer_selected'], unique=False)
+    op.create_index('ix_question_created_id', 'question', ['created', 'id'], unique=False)
+    op.create_index('ix_answer_id_user', 'answer', ['id_user'], unique=False)
+    op.create_index('ix_answer_id_question_created', 'answer', ['id_question', 'created'], unique=False)
+    op.create_index('ix_answer_created_id', 'answer', ['created', 'id'], unique=False)
+    op.create_index('ix_question_images_id_question', 'question_images', ['id_question'], unique=False)
+    op.create_index('ix_question_images_created_id', 'question_images', ['created', 'id'], unique=False)
+    op.create_index('ix_answer_images_id_answer', 'answer_images', ['id_answer'], unique=False)
+    op.create_index('ix_answer_images_created_id', 'answer_images', ['created', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_answer_images_created_id', table_name='answer_images')
+    op.drop_index('ix_answer_images_id_answer', table_name='answer_images')
+    op.drop_index('ix_question_images_created_id', table_name='question_images')
+    op.drop_index('ix_question_images_id_question', table_name='question_images')
+    op.drop_index('ix_answer_created_id', table_name='answer')
+    op.drop_index('ix_answer_id_question_created', table_name='answer')
+    op.drop_index('ix_answer_id_user', table_name='answer')
+    op.drop_index('ix_question_created_id', table_name='question')
+    op.drop_index('ix_question_id_answer_selected', table_name='question')
+    op.drop_index('ix_question_id_user', table_name='question')
+    op.drop_index('ix_user_created_id', table_name='user')
+    op.drop_index('ix_user_id_role', table_name='user')
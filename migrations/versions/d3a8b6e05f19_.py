@@ -0,0 +1,49 @@
+"""on delete cascade for answers and images
+
+Revision ID: d3a8b6e05f19
+Revises: c7e1f0a4d582
+Create Date: 2026-10-18 11:48:05.227931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a8b6e05f19'
+down_revision = 'c7e1f0a4d582'
+branch_labels = None
+depends_on = None
+
+# (name, table, column, referred table, ondelete)
+FOREIGN_KEYS = [
+    ('fk_answer_id_question', 'answer', 'id_question', 'question', 'CASCADE'),
+    ('fk_question_images_id_question', 'question_images', 'id_question', 'question', 'CASCADE'),
+    ('fk_answer_images_id_answer', 'answer_images', 'id_answer', 'answer', 'CASCADE'),
+    ('fk_question_id_answer_selected', 'question', 'id_answer_selected', 'answer', 'SET NULL'),
+]
+
+
+def replace_foreign_key(name, table, column, referred_table, ondelete):
+    # the existing constraints were created unnamed, look their names up in the live schema
+    inspector = sa.inspect(op.get_bind())
+    for foreign_key in inspector.get_foreign_keys(table):
+        if foreign_key['constrained_columns'] == [column] and foreign_key['name']:
+            op.drop_constraint(foreign_key['name'], table, type_='foreignkey')
+    op.create_foreign_key(name, table, referred_table, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    # SQLite can't alter constraints, the application delete path doesn't rely on them
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    for name, table, column, referred_table, ondelete in FOREIGN_KEYS:
+        replace_foreign_key(name, table, column, referred_table, ondelete)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    for name, table, column, referred_table, ondelete in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(None, table, referred_table, [column], ['id'])
@@ -0,0 +1,34 @@
+"""image dimensions and resized variants
+
+Revision ID: f1b9d4c3e726
+Revises: e5f0c2b8a647
+Create Date: 2026-10-18 13:20:44.081935
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b9d4c3e726'
+down_revision = 'e5f0c2b8a647'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('answer_images', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('answer_images', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('answer_images', sa.Column('variants', sa.Text(), nullable=True))
+    op.add_column('question_images', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('question_images', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('question_images', sa.Column('variants', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('question_images', 'variants')
+    op.drop_column('question_images', 'height')
+    op.drop_column('question_images', 'width')
+    op.drop_column('answer_images', 'variants')
+    op.drop_column('answer_images', 'height')
+    op.drop_column('answer_images', 'width')
@@ -1,6 +1,6 @@
 import os
 from flask_admin import Admin
-from models import db, User, Role, Question, Answer, QuestionImages, AnswerImages
+from models import db, User, Role, Question, Answer, QuestionImages, AnswerImages, Job
 from flask_admin.contrib.sqla import ModelView
 
 def setup_admin(app):
@@ -13,4 +13,5 @@ def setup_admin(app):
     admin.add_view(ModelView(Question, db.session))
     admin.add_view(ModelView(Answer, db.session))
     admin.add_view(ModelView(QuestionImages, db.session))
-    admin.add_view(ModelView(AnswerImages, db.session))
\ No newline at end of file
+    admin.add_view(ModelView(AnswerImages, db.session))
+    admin.add_view(ModelView(Job, db.session))
\ No newline at end of file
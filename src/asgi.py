@@ -0,0 +1,21 @@
+"""
+ASGI entry point, the async counterpart of wsgi.py: uvicorn asgi:application --app-dir src
+a2wsgi keeps the connections on the event loop and runs the Flask views in a pool of
+ASGI_THREADS threads, the same model as gunicorn -k gthread --threads N.
+"""
+import os
+from a2wsgi import WSGIMiddleware
+from main import app
+
+# each thread may hold a DB connection, keep it at or below DB_POOL_SIZE + DB_MAX_OVERFLOW
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 10))
+
+def terminated_input(wsgi_app):
+    # the body stream ends with the last ASGI body message. Without the flag werkzeug
+    # discards chunked bodies, which come without a Content-Length
+    def wrapper(environ, start_response):
+        environ["wsgi.input_terminated"] = True
+        return wsgi_app(environ, start_response)
+    return wrapper
+
+application = WSGIMiddleware(terminated_input(app), workers=ASGI_THREADS)
@@ -1,32 +1,156 @@
-import os, boto3, botocore
+import os, hashlib, boto3, botocore
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
 
-s3 = boto3.client(
-   "s3",
-   aws_access_key_id=os.environ.get('S3_ID'),
-   aws_secret_access_key=os.environ.get('S3_SECRET')
+MB = 1024 * 1024
+
+def create_s3_client():
+    # S3_ENDPOINT_URL points the client to a local stand-in such as moto_server or minio
+    return boto3.client(
+       "s3",
+       aws_access_key_id=os.environ.get('S3_ID'),
+       aws_secret_access_key=os.environ.get('S3_SECRET'),
+       endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None
+    )
+
+s3 = create_s3_client()
+
+# files over the threshold are streamed in multipart chunks instead of a single PUT
+transfer_config = TransferConfig(
+    multipart_threshold=int(os.environ.get('S3_MULTIPART_THRESHOLD_MB', 8)) * MB,
+    multipart_chunksize=int(os.environ.get('S3_MULTIPART_CHUNKSIZE_MB', 8)) * MB,
+    max_concurrency=int(os.environ.get('S3_MULTIPART_CONCURRENCY', 4))
 )
+UPLOAD_WORKERS = int(os.environ.get('S3_UPLOAD_WORKERS', 4))
+
+
+def s3_location(bucket_name):
+    if os.environ.get('S3_ENDPOINT_URL'):
+        return '{}/{}/'.format(os.environ.get('S3_ENDPOINT_URL').rstrip('/'), bucket_name)
+    return 'http://{}.s3.amazonaws.com/'.format(bucket_name)
 
 
-def upload_file_to_s3(file, bucket_name, acl="public-read"):
-    s3_location = 'http://{}.s3.amazonaws.com/'.format(bucket_name)
+def upload_file_to_s3(file, bucket_name, acl="public-read", client=None):
     """
     Docs: http://boto3.readthedocs.io/en/latest/guide/s3.html
     """
 
     try:
 
-        s3.upload_fileobj(
+        (client or s3).upload_fileobj(
             file,
             bucket_name,
             file.filename,
             ExtraArgs={
                 "ACL": acl,
                 "ContentType": file.content_type
-            }
+            },
+            Config=transfer_config
         )
 
     except Exception as e:
         print("Something Happened: ", e)
         return e
 
-    return "{}{}".format(s3_location, file.filename)
\ No newline at end of file
+    return "{}{}".format(s3_location(bucket_name), file.filename)
+
+
+def upload_files_to_s3(files, bucket_name, acl="public-read", client=None, max_workers=UPLOAD_WORKERS):
+    """
+    Uploads the files concurrently on a bounded thread pool.
+    Returns one result per file, in order: {"filename", "url"} or {"filename", "error"}.
+    """
+    def upload(file):
+        url = upload_file_to_s3(file, bucket_name, acl, client)
+        if isinstance(url, Exception):
+            return {"filename": file.filename, "error": str(url)}
+        return {"filename": file.filename, "url": url}
+
+    if not files:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+        return list(executor.map(upload, files))
+
+
+IMAGE_CONTENT_TYPES = ("image/jpeg", "image/png", "image/gif", "image/webp")
+MAX_IMAGE_SIZE = int(os.environ.get('S3_MAX_IMAGE_SIZE_MB', 10)) * MB
+PRESIGNED_EXPIRES = int(os.environ.get('S3_PRESIGNED_EXPIRES', 600))
+
+
+def presigned_image_upload(bucket_name, key, content_type, size, method="post", acl="public-read", client=None):
+    """
+    Lets the client send the image bytes straight to S3.
+    POST policies enforce the size range and content type on S3's side, PUT URLs sign the exact ones.
+    """
+    client = client or s3
+    if method == "put":
+        url = client.generate_presigned_url("put_object", Params={
+            "Bucket": bucket_name,
+            "Key": key,
+            "ContentType": content_type,
+            "ContentLength": size,
+            "ACL": acl
+        }, ExpiresIn=PRESIGNED_EXPIRES)
+        return {"method": "PUT", "url": url, "headers": {"Content-Type": content_type, "x-amz-acl": acl}}
+    post = client.generate_presigned_post(bucket_name, key,
+        Fields={"acl": acl, "Content-Type": content_type},
+        Conditions=[
+            {"acl": acl},
+            {"Content-Type": content_type},
+            ["content-length-range", 1, MAX_IMAGE_SIZE]
+        ],
+        ExpiresIn=PRESIGNED_EXPIRES)
+    return {"method": "POST", "url": post["url"], "fields": post["fields"]}
+
+
+def head_s3_object(bucket_name, key, client=None):
+    try:
+        return (client or s3).head_object(Bucket=bucket_name, Key=key)
+    except botocore.exceptions.ClientError:
+        return None
+
+
+def head_s3_objects(bucket_name, keys, client=None, max_workers=UPLOAD_WORKERS):
+    """
+    head_s3_object for several keys on a bounded thread pool, one result per key, in order.
+    """
+    if not keys:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as executor:
+        return list(executor.map(lambda key: head_s3_object(bucket_name, key, client), keys))
+
+
+def delete_s3_object(bucket_name, key, client=None):
+    (client or s3).delete_object(Bucket=bucket_name, Key=key)
+
+
+def download_s3_object(bucket_name, key, client=None):
+    return (client or s3).get_object(Bucket=bucket_name, Key=key)["Body"].read()
+
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def hash_file(file):
+    # sha256 of the stream read in chunks, the stream is left at its start
+    digest = hashlib.sha256()
+    file.stream.seek(0)
+    for chunk in iter(lambda: file.stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.stream.seek(0)
+    return digest.hexdigest()
+
+
+def content_key(content_hash, filename):
+    extension = os.path.splitext(filename or "")[1].lower()
+    return "images/{}/{}{}".format(content_hash[:2], content_hash, extension)
+
+
+def s3_key(bucket_name, url):
+    location = s3_location(bucket_name)
+    return url[len(location):] if url.startswith(location) else None
+
+
+def delete_s3_objects(bucket_name, keys, client=None):
+    if keys:
+        (client or s3).delete_objects(Bucket=bucket_name, Delete={"Objects": [{"Key": key} for key in keys]})
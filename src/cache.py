@@ -0,0 +1,210 @@
+import os, json, time, base64, itertools, threading
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, make_response
+from compression import compressor
+
+class LRUCache():
+    """
+    In-process cache with a maximum number of entries and a per entry TTL.
+    Every worker holds its own copy, so invalidations only reach the worker that made the write.
+    """
+    def __init__(self, max_entries=1024, max_counters=None):
+        self.max_entries = max_entries
+        # an entry carries a few tags, the least recently used counters beyond that are dropped
+        self.max_counters = max_counters or max_entries * 4
+        self.entries = OrderedDict()
+        self.counters = OrderedDict()
+        # every counter value comes from one sequence: a dropped counter comes back with a value
+        # no entry was ever stored under, so its old entries stay unreachable
+        self.versions = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.time() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_counters(self, keys):
+        with self.lock:
+            counters = []
+            for key in keys:
+                if key not in self.counters:
+                    self.counters[key] = next(self.versions)
+                self.counters.move_to_end(key)
+                counters.append(self.counters[key])
+            self.evict_counters()
+            return counters
+
+    def incr(self, key):
+        with self.lock:
+            self.counters[key] = next(self.versions)
+            self.counters.move_to_end(key)
+            self.evict_counters()
+            return self.counters[key]
+
+    def evict_counters(self):
+        while len(self.counters) > self.max_counters:
+            self.counters.popitem(last=False)
+
+    def mark(self, key, ttl):
+        self.set(key, True, ttl)
+
+    def marked(self, key):
+        return self.get(key) is not None
+
+class RedisCache():
+    """
+    Cache stored in any client exposing the redis-py get/set/mget/incr interface,
+    shared by every worker. fakeredis.FakeStrictRedis() can stand in for a server locally.
+    """
+    def __init__(self, client, prefix="questioner:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        value["body"] = base64.b64decode(value["body"])
+        value["compressed"] = {encoding: base64.b64decode(body)
+            for encoding, body in value.get("compressed", {}).items()}
+        return value
+
+    def set(self, key, value, ttl):
+        raw = dict(value, body=base64.b64encode(value["body"]).decode("ascii"),
+            compressed={encoding: base64.b64encode(body).decode("ascii")
+                for encoding, body in value.get("compressed", {}).items()})
+        self.client.set(self.prefix + key, json.dumps(raw), ex=int(ttl))
+
+    def get_counters(self, keys):
+        keys = [self.prefix + key for key in keys]
+        counters = self.client.mget(keys)
+        for i, counter in enumerate(counters):
+            if counter is None:
+                # an evicted counter must not restart at a value an old entry was stored under
+                self.client.set(keys[i], int(time.time() * 1000), nx=True)
+                counters[i] = self.client.get(keys[i])
+        return [int(counter) for counter in counters]
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def mark(self, key, ttl):
+        self.client.set(self.prefix + key, 1, ex=max(1, int(ttl)))
+
+    def marked(self, key):
+        return self.client.exists(self.prefix + key) > 0
+
+class ResponseCache():
+    """
+    Read-through cache for GET responses. Every entry is tagged with the entities it was built from
+    (e.g. "question:12"), writes invalidate tags by bumping their version, which makes every key
+    built with the previous version unreachable.
+    """
+    def __init__(self, backend=None, ttl=60):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "endpoints": {}}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        name = os.environ.get('CACHE_BACKEND', 'none')
+        ttl = int(os.environ.get('CACHE_TTL', 60))
+        if name == 'lru':
+            return cls(LRUCache(int(os.environ.get('CACHE_MAX_ENTRIES', 1024))), ttl)
+        if name == 'redis':
+            return cls(RedisCache.from_url(os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')), ttl)
+        return cls(None, ttl)
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def count(self, endpoint, result):
+        with self.lock:
+            self.stats[result] += 1
+            endpoint_stats = self.stats["endpoints"].setdefault(endpoint, {"hits": 0, "misses": 0})
+            endpoint_stats[result] += 1
+
+    def key(self, tags):
+        counters = self.backend.get_counters(["tag:" + tag for tag in tags])
+        versions = ",".join("{}={}".format(tag, counter) for tag, counter in zip(tags, counters))
+        # the ETag of conditional(), when the view has one: an entry left behind by a write on
+        # another worker is never served once the data it was built from changed
+        return "response:{}|{}|{}".format(request.full_path, versions, g.get("validator_etag", ""))
+
+    def cached(self, tags, ttl=None):
+        """
+        tags receives the view arguments and returns the list of tags of the response.
+        Only 200 responses are stored, together with their compressed bodies so hits
+        are not compressed again.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                key = self.key(tags(**kwargs))
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self.count(request.endpoint, "hits")
+                    response = make_response(entry["body"], entry["status"], entry["headers"])
+                    return self.encoded(response, entry.get("compressed", {}))
+                self.count(request.endpoint, "misses")
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    compressed = compressor.precompress(response)
+                    self.backend.set(key, {
+                        "body": response.get_data(),
+                        "status": response.status_code,
+                        "headers": list(response.headers.items()),
+                        "compressed": compressed
+                    }, ttl or self.ttl)
+                    return self.encoded(response, compressed)
+                return response
+            return wrapper
+        return decorator
+
+    def encoded(self, response, compressed):
+        encoding = compressor.negotiate() if compressed else None
+        if encoding not in compressed:
+            return response
+        return compressor.encode(response, compressed[encoding], encoding)
+
+    def invalidate(self, *tags):
+        if not self.enabled:
+            return
+        for tag in tags:
+            self.backend.incr("tag:" + tag)
+        with self.lock:
+            self.stats["invalidations"] += len(tags)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, endpoints=dict(self.stats["endpoints"]))
+        stats["backend"] = type(self.backend).__name__ if self.enabled else None
+        return stats
+
+response_cache = ResponseCache.from_env()
@@ -0,0 +1,77 @@
+import os, gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIMETYPES = ("application/json", "application/x-ndjson", "text/plain", "text/html",
+    "text/css", "application/javascript")
+
+class Compressor():
+    """
+    Negotiates gzip or brotli from Accept-Encoding and compresses responses of at least min_size bytes.
+    Brotli is offered only when the brotli package is installed.
+    """
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        # preferred first when the client accepts both equally
+        self.encodings = (("br",) if brotli is not None else ()) + ("gzip",)
+
+    @classmethod
+    def from_env(cls):
+        return cls(int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+            int(os.environ.get('COMPRESS_LEVEL', 6)),
+            int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4)))
+
+    def negotiate(self):
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = request.accept_encodings.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, data, encoding):
+        if encoding == "br":
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level)
+
+    def compressible(self, response):
+        return (response.mimetype in COMPRESS_MIMETYPES and not response.is_streamed
+            and response.status_code not in (204, 206, 304) and "Content-Encoding" not in response.headers)
+
+    def precompress(self, response):
+        """
+        {encoding: body} in every supported encoding, what the response cache stores next to the plain body.
+        """
+        if not self.compressible(response):
+            return {}
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return {}
+        return {encoding: self.compress(data, encoding) for encoding in self.encodings}
+
+    def encode(self, response, body, encoding):
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def after_request(self, response):
+        if not self.compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.negotiate()
+        data = response.get_data()
+        if encoding is None or len(data) < self.min_size:
+            return response
+        return self.encode(response, self.compress(data, encoding), encoding)
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+compressor = Compressor.from_env()
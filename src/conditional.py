@@ -0,0 +1,94 @@
+import datetime, hashlib
+from functools import wraps
+from flask import g, request, make_response
+from sqlalchemy import func, or_
+from models import db, Role, User, Question, Answer, QuestionImages, AnswerImages
+from utils import page_args, page_query
+
+def conditional(validator, last_modified=False):
+    """
+    Answers If-None-Match / If-Modified-Since with a 304 before the view runs.
+    validator receives the view arguments and returns the values the response depends on
+    (last_update columns and row counts or ids, so deletes change the ETag too), or None to skip the check.
+    The ETag is also part of the response cache key, so a cached body is only served under the ETag it was built for.
+    Last-Modified and If-Modified-Since are only used with last_modified=True, for validators whose dates
+    move on every change of the response: a delete doesn't move max(last_update).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            values = validator(**kwargs)
+            if values is None:
+                return view(*args, **kwargs)
+            etag = hashlib.sha1(repr(values).encode("utf-8")).hexdigest()
+            modified = last_modified_date(values) if last_modified else None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = (request.if_modified_since is not None and modified is not None
+                    and modified <= request.if_modified_since.replace(tzinfo=None))
+            if not_modified:
+                response = make_response("", 304)
+            else:
+                g.validator_etag = etag
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if modified is not None:
+                response.last_modified = modified
+            return response
+        return wrapper
+    return decorator
+
+def last_modified_date(values):
+    """
+    max of the datetime values in whole seconds, the resolution of Last-Modified. None while it is
+    in the current second: a second write in that second would get the same date and a false 304.
+    """
+    dates = [value for value in values if isinstance(value, datetime.datetime)]
+    if not dates or max(dates) >= datetime.datetime.now().replace(microsecond=0):
+        return None
+    return max(dates).replace(microsecond=0)
+
+def max_and_count(model, *filters):
+    return [db.session.query(func.max(model.last_update)).filter(*filters).as_scalar(),
+        db.session.query(func.count(model.id)).filter(*filters).as_scalar()]
+
+def aggregate(*columns):
+    return list(db.session.query(*columns).one())
+
+def roles_validator():
+    return aggregate(*max_and_count(Role))
+
+def questions_validator():
+    # only the requested page, read on the (created, id) index like the listing itself. The row after
+    # the page is included since it decides X-Next-Cursor, the ids make deletes change the ETag
+    cursor, limit = page_args()
+    rows = page_query(db.session.query(Question.id, Question.last_update, Question.answer_count, User.last_update)
+        .outerjoin(User, User.id == Question.id_user), Question, cursor, limit).all()
+    return [value for row in rows for value in row]
+
+def question_validator(id):
+    values = db.session.query(Question.last_update, User.last_update).outerjoin(
+        User, User.id == Question.id_user).filter(Question.id == id).first()
+    return list(values) if values is not None else None
+
+def answers_validator(id):
+    answer_users = db.session.query(Answer.id_user).filter(Answer.id_question == id)
+    return aggregate(*max_and_count(Answer, Answer.id_question == id),
+        db.session.query(func.max(User.last_update)).filter(User.id.in_(answer_users)).as_scalar())
+
+def thread_validator(id):
+    question_last_update = db.session.query(Question.last_update).filter(Question.id == id).as_scalar()
+    question_user = db.session.query(Question.id_user).filter(Question.id == id).as_scalar()
+    answer_ids = db.session.query(Answer.id).filter(Answer.id_question == id)
+    answer_users = db.session.query(Answer.id_user).filter(Answer.id_question == id)
+    values = aggregate(question_last_update,
+        *max_and_count(Answer, Answer.id_question == id),
+        *max_and_count(QuestionImages, QuestionImages.id_question == id),
+        *max_and_count(AnswerImages, AnswerImages.id_answer.in_(answer_ids)),
+        db.session.query(func.max(User.last_update)).filter(
+            or_(User.id == question_user, User.id.in_(answer_users))).as_scalar())
+    return values if values[0] is not None else None
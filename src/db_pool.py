@@ -0,0 +1,87 @@
+import os, time, threading
+from sqlalchemy import event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+STATEMENT_TIMEOUT_SQL = {
+    "postgresql": "SET statement_timeout = {}",
+    "mysql": "SET SESSION max_execution_time = {}"
+}
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that measures how long checkouts wait for a free connection.
+    """
+    def __init__(self, *args, **kwargs):
+        QueuePool.__init__(self, *args, **kwargs)
+        self.lock = threading.Lock()
+        self.wait_stats = {"checkouts": 0, "timeouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return QueuePool._do_get(self)
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self.lock:
+                self.wait_stats["checkouts"] += 1
+                self.wait_stats["timeouts"] += timed_out
+                self.wait_stats["wait_seconds_total"] += waited
+                self.wait_stats["wait_seconds_max"] = max(self.wait_stats["wait_seconds_max"], waited)
+
+def env_flag(name, default):
+    return os.environ.get(name, default).lower() == 'true'
+
+def engine_options(database_uri):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured database, driven by the DB_POOL_* env vars.
+    SQLite keeps the SQLAlchemy defaults, it doesn't use a QueuePool.
+    """
+    if not database_uri:
+        return {}
+    dialect = make_url(database_uri).get_backend_name()
+    if dialect == "sqlite":
+        return {}
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.environ.get('DB_POOL_SIZE', 5)),
+        "max_overflow": int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        "pool_timeout": int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        # recycle before MySQL's wait_timeout closes idle connections on the server side
+        "pool_recycle": int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        "pool_pre_ping": env_flag('DB_POOL_PRE_PING', 'true')
+    }
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if statement_timeout and dialect in STATEMENT_TIMEOUT_SQL:
+        sql = STATEMENT_TIMEOUT_SQL[dialect].format(statement_timeout)
+
+        def set_statement_timeout(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(sql)
+            cursor.close()
+            dbapi_connection.commit()
+
+        # listen on a subclass so the timeout only applies to pools built from these options
+        options["poolclass"] = type("TimedQueuePool", (TimedQueuePool,), {})
+        event.listen(options["poolclass"], "connect", set_statement_timeout)
+    return options
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__, "pid": os.getpid()}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "timeout": pool.timeout()
+        })
+    if isinstance(pool, TimedQueuePool):
+        with pool.lock:
+            stats.update(pool.wait_stats)
+    return stats
@@ -0,0 +1,137 @@
+import os, itertools, threading
+from functools import wraps
+from flask import g, request, has_app_context, current_app
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.pool import QueuePool
+from cache import LRUCache, RedisCache, response_cache
+
+REPLICA_BIND_PREFIX = "replica_"
+REPLICA_STRATEGIES = ("round-robin", "least-connections")
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+def replica_binds():
+    """
+    SQLALCHEMY_BINDS entries for the comma separated DB_REPLICA_CONNECTION_STRINGS,
+    one "replica_<n>" bind per replica. The primary stays SQLALCHEMY_DATABASE_URI.
+    """
+    uris = [uri.strip() for uri in os.environ.get('DB_REPLICA_CONNECTION_STRINGS', '').split(',') if uri.strip()]
+    return {"{}{}".format(REPLICA_BIND_PREFIX, i): uri for i, uri in enumerate(uris)}
+
+class ReplicaRouter():
+    """
+    Picks the replica a read only request runs on and remembers who wrote recently.
+    A client that made a write is pinned to the primary for pin_seconds so it reads its own
+    writes while the replicas catch up. Pins are kept in the redis cache backend when
+    CACHE_BACKEND=redis, so the read finds the pin on any worker or dyno. Otherwise they only
+    reach the worker process that handled the write.
+    """
+    def __init__(self, strategy="round-robin", pin_seconds=5, pins=None):
+        if strategy not in REPLICA_STRATEGIES:
+            raise ValueError("Unknown replica strategy " + strategy)
+        self.strategy = strategy
+        self.pin_seconds = pin_seconds
+        self.pins = pins if pins is not None else LRUCache(max_entries=10000)
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.stats = {"primary_reads": 0, "replica_reads": 0, "pinned_reads": 0}
+
+    @classmethod
+    def from_env(cls):
+        shared = response_cache.backend if isinstance(response_cache.backend, RedisCache) else None
+        return cls(os.environ.get('DB_REPLICA_STRATEGY', 'round-robin'),
+            int(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 5)), shared)
+
+    def binds(self, app):
+        return sorted(bind for bind in (app.config.get('SQLALCHEMY_BINDS') or {})
+            if bind.startswith(REPLICA_BIND_PREFIX))
+
+    def choose(self, db, app):
+        binds = self.binds(app)
+        if not binds:
+            return None
+        if self.strategy == "round-robin":
+            return binds[next(self.counter) % len(binds)]
+
+        def checked_out(bind):
+            pool = db.get_engine(app, bind).pool
+            return pool.checkedout() if isinstance(pool, QueuePool) else 0
+        # ties go to the replica after the last one picked so idle replicas share the load
+        start = next(self.counter)
+        rotated = binds[start % len(binds):] + binds[:start % len(binds)]
+        return min(rotated, key=checked_out)
+
+    def client_key(self):
+        try:
+            from flask_jwt_extended import get_jwt_identity
+            identity = get_jwt_identity()
+        except Exception:
+            identity = None
+        if identity is not None:
+            return "user:{}".format(identity)
+        return "addr:{}".format(request.remote_addr)
+
+    def pin(self, key):
+        if self.pin_seconds > 0:
+            self.pins.mark("pin:" + key, self.pin_seconds)
+
+    def pinned(self, key):
+        return self.pin_seconds > 0 and self.pins.marked("pin:" + key)
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def get_stats(self, app):
+        with self.lock:
+            stats = dict(self.stats)
+        stats.update({"strategy": self.strategy, "pin_seconds": self.pin_seconds, "replicas": self.binds(app),
+            "pins": type(self.pins).__name__})
+        return stats
+
+    def read_only(self, view):
+        """
+        Runs the view, and every decorator below it, on a replica. Put it under @jwt_required
+        so the pin lookup sees the user identity.
+        """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if self.pinned(self.client_key()):
+                self.count("pinned_reads")
+            else:
+                g.replica_bind = self.choose(current_app.extensions['sqlalchemy'].db, current_app)
+                self.count("replica_reads" if g.replica_bind else "primary_reads")
+            return view(*args, **kwargs)
+        return wrapper
+
+    def init_app(self, app):
+        if self.binds(app) and self.pin_seconds > 0 and isinstance(self.pins, LRUCache):
+            print("Read your writes pins are kept per process, set CACHE_BACKEND=redis to share them between workers")
+
+        @app.after_request
+        def pin_writers(response):
+            if request.method in WRITE_METHODS and response.status_code < 400:
+                self.pin(self.client_key())
+            return response
+
+replica_router = ReplicaRouter.from_env()
+
+class RoutingSession(SignallingSession):
+    """
+    Session that reads from the replica chosen for the request. Flushes always go to the
+    primary, a read only view that writes anyway is not sent to a replica.
+    """
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and has_app_context():
+            bind = g.get('replica_bind')
+            if bind is not None:
+                return self.db.get_engine(self.app, bind=bind)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,46 @@
+import os
+from flask import request, json, stream_with_context, Response
+from utils import APIException
+
+EXPORT_MIMETYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson"
+}
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+
+def export_format():
+    """
+    The ?export=json|ndjson format of a full table export, None for the regular paginated response.
+    """
+    export = request.args.get('export')
+    if export is not None and export not in EXPORT_MIMETYPES:
+        raise APIException('Invalid export format, use json or ndjson', status_code=400)
+    return export
+
+def export_rows(query, serialize, export):
+    # server side cursor where the driver has one, rows are fetched and encoded EXPORT_BATCH_SIZE at a time
+    rows = query.execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+    batch = []
+    first = True
+    if export == "json":
+        yield "["
+    for row in rows:
+        item = json.dumps(serialize(row), separators=(",", ":"))
+        if export == "json":
+            batch.append(item if first else "," + item)
+            first = False
+        else:
+            batch.append(item + "\n")
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield "".join(batch)
+            batch = []
+    yield "".join(batch)
+    if export == "json":
+        yield "]\n"
+
+def stream_export(query, serialize, export):
+    """
+    Streams every row of query as a JSON array or as NDJSON, the whole table is never held in memory.
+    """
+    return Response(stream_with_context(export_rows(query, serialize, export)),
+        mimetype=EXPORT_MIMETYPES[export])
@@ -0,0 +1,71 @@
+import os, io
+from werkzeug.datastructures import FileStorage
+
+# variant name -> longest side in pixels
+IMAGE_VARIANTS = {"thumb": 200, "medium": 800}
+VARIANT_FORMAT = "WEBP"
+VARIANT_CONTENT_TYPE = "image/webp"
+VARIANT_QUALITY = int(os.environ.get('IMAGE_VARIANT_QUALITY', 80))
+
+def file_size(file):
+    stream = file.stream if isinstance(file, FileStorage) else file
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+def variant_filename(filename, name):
+    return "{}.{}.webp".format(os.path.splitext(filename)[0], name)
+
+def process_image(file):
+    """
+    Decodes the image once and builds the resized WebP variants.
+    Returns {"size", "width", "height", "variants": [{"name", "file", "width", "height", "size"}]},
+    width, height and variants stay empty when Pillow is missing or the file is not an image.
+    Leaves the file stream at its start so the original can be uploaded afterwards.
+    """
+    info = {"size": file_size(file), "width": None, "height": None, "variants": []}
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return info
+    try:
+        image = ImageOps.exif_transpose(Image.open(file.stream))
+        image.load()
+    except Exception as e:
+        print("Image not decoded: ", e)
+        file.stream.seek(0)
+        return info
+    file.stream.seek(0)
+    info["width"], info["height"] = image.size
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    for name, longest_side in IMAGE_VARIANTS.items():
+        if max(image.size) <= longest_side:
+            continue
+        variant = image.copy()
+        variant.thumbnail((longest_side, longest_side), Image.LANCZOS)
+        data = io.BytesIO()
+        variant.save(data, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+        data.seek(0)
+        info["variants"].append({
+            "name": name,
+            "file": FileStorage(stream=data, filename=variant_filename(file.filename, name),
+                content_type=VARIANT_CONTENT_TYPE),
+            "width": variant.size[0],
+            "height": variant.size[1],
+            "size": len(data.getvalue())
+        })
+    return info
+
+def uploaded_variants(info, results):
+    """
+    results holds one upload result per variant of info, in order.
+    Returns the variants column value: {name: {"url", "width", "height", "size"}} of the uploaded ones.
+    """
+    variants = {}
+    for variant, result in zip(info["variants"], results):
+        if "url" in result:
+            variants[variant["name"]] = {"url": result["url"], "width": variant["width"],
+                "height": variant["height"], "size": variant["size"]}
+    return variants
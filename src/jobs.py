@@ -0,0 +1,133 @@
+import os, json, time, socket, datetime, traceback
+from concurrent.futures import ThreadPoolExecutor
+from models import db, Job
+
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 2))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_BACKOFF_SECONDS = int(os.environ.get('JOB_BACKOFF_SECONDS', 10))
+JOB_MAX_BACKOFF_SECONDS = int(os.environ.get('JOB_MAX_BACKOFF_SECONDS', 3600))
+# running jobs older than this are considered abandoned by a dead worker
+JOB_TIMEOUT_SECONDS = int(os.environ.get('JOB_TIMEOUT_SECONDS', 900))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1))
+
+tasks = {}
+# called with the last payload of a job that ran out of attempts, to clean up what it left behind
+failure_handlers = {}
+
+class JobRetry(Exception):
+    """
+    Raised by a task that partly succeeded: the job is retried with the remaining payload.
+    """
+    def __init__(self, message, payload):
+        Exception.__init__(self, message)
+        self.payload = payload
+
+def task(name, on_failed=None):
+    def decorator(fn):
+        tasks[name] = fn
+        if on_failed is not None:
+            failure_handlers[name] = on_failed
+        return fn
+    return decorator
+
+def enqueue(name, payload, max_attempts=JOB_MAX_ATTEMPTS, run_at=None):
+    if name not in tasks:
+        raise ValueError("Unknown task " + name)
+    now = datetime.datetime.now()
+    job = Job(name=name, payload=json.dumps(payload), status="queued", attempts=0,
+        max_attempts=max_attempts, run_at=run_at or now, created=now, last_update=now)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def backoff(attempts):
+    return datetime.timedelta(seconds=min(JOB_BACKOFF_SECONDS * 2 ** (attempts - 1), JOB_MAX_BACKOFF_SECONDS))
+
+def requeue_abandoned():
+    timeout = datetime.datetime.now() - datetime.timedelta(seconds=JOB_TIMEOUT_SECONDS)
+    Job.query.filter(Job.status == "running", Job.last_update < timeout).update(
+        {Job.status: "queued", Job.worker: None}, synchronize_session=False)
+    db.session.commit()
+
+def claim_jobs(worker, limit):
+    """
+    Claims up to limit due jobs. The conditional UPDATE makes the claim safe with several
+    workers on every dialect, only the worker whose UPDATE matched the queued row gets it.
+    """
+    now = datetime.datetime.now()
+    candidates = db.session.query(Job.id).filter(Job.status == "queued", Job.run_at <= now
+        ).order_by(Job.run_at, Job.id).limit(limit).all()
+    claimed = []
+    for (id,) in candidates:
+        updated = Job.query.filter(Job.id == id, Job.status == "queued").update(
+            {Job.status: "running", Job.worker: worker, Job.last_update: now}, synchronize_session=False)
+        db.session.commit()
+        if updated == 1:
+            claimed.append(id)
+    return claimed
+
+def run_job(id):
+    job = Job.query.get(id)
+    try:
+        result = tasks[job.name](json.loads(job.payload))
+    except Exception as e:
+        db.session.rollback()
+        job = Job.query.get(id)
+        job.attempts += 1
+        if isinstance(e, JobRetry):
+            job.payload = json.dumps(e.payload)
+        job.last_error = "{}: {}".format(type(e).__name__, e)[:1000]
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+            print(traceback.format_exc())
+            give_up(job)
+        else:
+            job.status = "queued"
+            job.run_at = datetime.datetime.now() + backoff(job.attempts)
+        job.worker = None
+    else:
+        job.attempts += 1
+        job.status = "done"
+        job.result = json.dumps(result)
+        job.last_error = None
+    job.last_update = datetime.datetime.now()
+    db.session.commit()
+    return job.status
+
+def give_up(job):
+    handler = failure_handlers.get(job.name)
+    if handler is None:
+        return
+    try:
+        handler(json.loads(job.payload))
+    except Exception:
+        # the job stays failed either way
+        print(traceback.format_exc())
+
+def run_worker(app, concurrency=JOB_CONCURRENCY, once=False):
+    """
+    Polls the job table and runs at most `concurrency` jobs at the same time,
+    each one in its own thread with its own app context and session.
+    """
+    worker = "{}:{}".format(socket.gethostname(), os.getpid())
+
+    def run_in_context(id):
+        with app.app_context():
+            try:
+                return run_job(id)
+            finally:
+                db.session.remove()
+
+    with app.app_context(), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        running = set()
+        while True:
+            running = set(future for future in running if not future.done())
+            requeue_abandoned()
+            free = concurrency - len(running)
+            claimed = claim_jobs(worker, free) if free > 0 else []
+            for id in claimed:
+                running.add(executor.submit(run_in_context, id))
+            if once and not claimed and not running:
+                return
+            if not claimed:
+                time.sleep(JOB_POLL_SECONDS)
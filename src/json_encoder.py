@@ -0,0 +1,61 @@
+import os, datetime
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_SERIALIZERS = ("auto", "orjson", "stdlib")
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+def http_date(value):
+    """
+    Same string as werkzeug's http_date, the format Flask's encoder gives dates,
+    without going through time tuples.
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc)
+        hour, minute, second = value.hour, value.minute, value.second
+    else:
+        hour, minute, second = 0, 0, 0
+    return "{}, {:02d} {} {:04d} {:02d}:{:02d}:{:02d} GMT".format(WEEKDAYS[value.weekday()], value.day,
+        MONTHS[value.month - 1], value.year, hour, minute, second)
+
+def json_serializer():
+    serializer = os.environ.get('JSON_SERIALIZER', 'auto')
+    if serializer not in JSON_SERIALIZERS:
+        raise ValueError("Unknown JSON serializer " + serializer)
+    if serializer == "orjson" and orjson is None:
+        raise ImportError("JSON_SERIALIZER is orjson but orjson is not installed")
+    if serializer == "auto":
+        return "orjson" if orjson is not None else "stdlib"
+    return serializer
+
+class FastJSONEncoder(JSONEncoder):
+    """
+    app.json_encoder producing the same JSON as Flask's encoder. jsonify calls encode(),
+    which hands the whole document to orjson when it is selected, dates keep the HTTP date format.
+    """
+    serializer = json_serializer()
+
+    def default(self, o):
+        if isinstance(o, datetime.date):
+            return http_date(o)
+        return JSONEncoder.default(self, o)
+
+    def encode(self, o):
+        if self.serializer != "orjson":
+            return JSONEncoder.encode(self, o)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(o, default=self.default, option=option).decode("utf-8")
+        except TypeError:
+            # values orjson refuses, like integers over 64 bits, still work with the stdlib encoder
+            return JSONEncoder.encode(self, o)
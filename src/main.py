@@ -6,19 +6,51 @@ from flask import Flask, request, jsonify, url_for
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
+from utils import APIException, generate_sitemap, page_args, paginate, page_headers
 from admin import setup_admin
-from models import db, User, Role, Question, Answer, QuestionImages, AnswerImages
+from models import db, User, Role, Question, Answer, QuestionImages, AnswerImages, Job
 from helpers import DBManager
 import datetime
+import click
 from flask_jwt_extended import (
     JWTManager, jwt_required, create_access_token,
     get_jwt_identity
 )
-from aws import upload_file_to_s3
+from aws import (
+    upload_files_to_s3, presigned_image_upload, head_s3_object, head_s3_objects, delete_s3_object,
+    delete_s3_objects, download_s3_object, s3_location, hash_file, content_key,
+    IMAGE_CONTENT_TYPES, MAX_IMAGE_SIZE
+)
+from werkzeug.utils import secure_filename
+from werkzeug.datastructures import FileStorage
+from jobs import task, enqueue, run_worker, JobRetry, JOB_CONCURRENCY
+from images import process_image, uploaded_variants
+from storage import find_stored_image, url_references, stored_images, release_stored_images
+import uuid, io, json
+from queries import (
+    questions_listing_query, answers_listing_query, serialize_rows,
+    thread_query, serialize_thread,
+    delete_question_cascade, count_answer_added, count_answer_removed, count_question_images, recount_questions
+)
+from search import search_questions
+from search_index import question_index
+from schema_check import index_drift
+from cache import response_cache
+from compression import compressor
+from db_pool import engine_options, pool_stats
+from json_encoder import FastJSONEncoder
+from export import export_format, stream_export
+from db_routing import replica_binds, replica_router
+from profiling import profiler
+import query_guard
+from conditional import (
+    conditional, roles_validator, questions_validator, question_validator,
+    answers_validator, thread_validator
+)
 from sqlalchemy import and_, or_, not_
 
 app = Flask(__name__)
+app.json_encoder = FastJSONEncoder
 
 app.config['JWT_SECRET_KEY'] = '546asdf8965as4f6987wetr654'
 jwt = JWTManager(app)
@@ -26,10 +58,16 @@ jwt = JWTManager(app)
 app.url_map.strict_slashes = False
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DB_CONNECTION_STRING')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['SQLALCHEMY_BINDS'] = replica_binds()
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = datetime.timedelta(days=30)
 MIGRATE = Migrate(app, db)
 db.init_app(app)
-CORS(app)
+replica_router.init_app(app)
+profiler.init_app(app)
+query_guard.init_app(app)
+compressor.init_app(app)
+CORS(app, expose_headers=["X-Next-Cursor"])
 setup_admin(app)
 
 # Handle/serialize errors like a JSON object
@@ -37,6 +75,10 @@ setup_admin(app)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
+@app.before_first_request
+def build_search_index():
+    question_index.build()
+
 @app.cli.command("create-roles")
 def create_roles():
     print("create_roles")
@@ -48,14 +90,69 @@ def create_roles():
         role = Role(id=2, name="User", created=now, last_update=now)
         role.save()
     DBManager.commitSession()
+    response_cache.invalidate("roles")
     return
 
+@app.cli.command("worker")
+@click.option("--concurrency", default=None, type=int, help="Jobs run at the same time")
+@click.option("--once", is_flag=True, help="Exit when the queue is empty")
+def worker(concurrency, once):
+    print("worker")
+    run_worker(app, concurrency or JOB_CONCURRENCY, once)
+
+@app.cli.command("recount")
+@click.option("--batch-size", default=1000, type=int, help="Questions updated per transaction")
+def recount(batch_size):
+    print("recount")
+    updated = recount_questions(batch_size)
+    response_cache.invalidate("questions")
+    print("{} questions recounted".format(updated))
+
+@app.cli.command("check-indexes")
+def check_indexes():
+    problems = index_drift(db.engine)
+    for problem in problems:
+        print(problem)
+    if problems:
+        raise SystemExit("Index drift detected: {} problem(s)".format(len(problems)))
+    print("Indexes match the models")
+
 # generate sitemap with all your endpoints
 @app.route('/')
 def sitemap():
     return generate_sitemap(app)
     #return "", 200
 
+@app.route('/cache-stats', methods=['GET'])
+@jwt_required
+def get_cache_stats():
+    return jsonify(response_cache.get_stats()), 200
+
+@app.route('/pool-stats', methods=['GET'])
+@jwt_required
+def get_pool_stats():
+    stats = pool_stats(db.engine)
+    stats["replicas"] = {bind: pool_stats(db.get_engine(app, bind)) for bind in replica_router.binds(app)}
+    return jsonify(stats), 200
+
+@app.route('/replica-stats', methods=['GET'])
+@jwt_required
+def get_replica_stats():
+    return jsonify(replica_router.get_stats(app)), 200
+
+@app.route('/metrics', methods=['GET'])
+@jwt_required
+def get_metrics():
+    return profiler.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route('/job/<int:id>', methods=['GET'])
+@jwt_required
+def get_job(id):
+    job = Job.query.get(id)
+    if job is None:
+        raise APIException('Job not found', status_code=404)
+    return jsonify(job.serialize()), 200
+
 #region login_logout
 @app.route('/login', methods=['POST'])
 def login():
@@ -94,6 +191,8 @@ def logout():
 #region role_endpoints
 @app.route('/roles', methods=['GET'])
 @jwt_required
+@conditional(roles_validator)
+@response_cache.cached(lambda: ["roles"])
 def get_roles():
     roles = Role.query.all()
     all_roles = list(map(lambda x: x.serialize(), roles))
@@ -119,9 +218,13 @@ def get_user_by_email(email):
 @app.route('/users', methods=['GET'])
 @jwt_required
 def get_users():
-    users = User.query.all()
+    export = export_format()
+    if export:
+        return stream_export(User.query.order_by(User.created, User.id), lambda x: x.serialize(), export)
+    cursor, limit = page_args()
+    users, next_cursor = paginate(User.query, User, cursor, limit)
     all_users = list(map(lambda x: x.serialize(), users))
-    return jsonify(all_users), 200
+    return jsonify(all_users), 200, page_headers(next_cursor)
 
 @app.route('/user', methods=['POST'])
 def add_user():
@@ -148,6 +251,7 @@ def update_user(id):
     now = datetime.datetime.now()
     user.last_update = now
     db.session.commit() 
+    response_cache.invalidate("users")
     return jsonify("User updated"), 200
 
 @app.route('/user-is-active', methods=['PUT'])
@@ -162,30 +266,49 @@ def update_user_is_active():
     now = datetime.datetime.now()
     user.last_update = now
     db.session.commit() 
+    response_cache.invalidate("users")
     return jsonify("User is_active updated"), 200
 #endregion user_endpoints
 
 #region question_endpoints
 @app.route('/questions', methods=['GET'])
 @jwt_required
+@replica_router.read_only
+@conditional(questions_validator)
+@response_cache.cached(lambda: ["questions", "users"])
 def get_questions():
-    questions = Question.query.all()
-    all_questions = list(map(lambda x: x.serialize(), questions))
-    for x in all_questions:
-        number = Answer.query.filter_by(id_question=x["id"]).count()
-        x["number_of_answers"] = number
-        user = User.query.filter_by(id=x["id_user"]).first()
-        x["user_name"] = user.name
-    return jsonify(all_questions), 200
+    cursor, limit = page_args()
+    rows, next_cursor = paginate(questions_listing_query(), Question, cursor, limit)
+    all_questions = serialize_rows(rows)
+    return jsonify(all_questions), 200, page_headers(next_cursor)
 
 @app.route('/question/<int:id>', methods=['GET'])
 @jwt_required
+@replica_router.read_only
+@conditional(question_validator, last_modified=True)
+@response_cache.cached(lambda id: ["question:{}".format(id), "users"])
 def get_question(id):
-    question = Question.query.get(id)
+    question = Question.query.options(Question.load_user()).get(id)
     if question is None:
         raise APIException('Question not found', status_code=404)
     return jsonify(question.serialize_with_user()), 200
 
+@app.route('/thread/<int:id>', methods=['GET'])
+@jwt_required
+@replica_router.read_only
+@conditional(thread_validator)
+@response_cache.cached(lambda id: ["question:{}".format(id), "answers:{}".format(id), "users"])
+def get_thread(id):
+    fields = request.args.get('fields')
+    if fields is not None:
+        fields = set(fields.split(','))
+    with_answers = fields is None or "answers" in fields
+    with_images = fields is None or "images" in fields
+    question = thread_query(with_answers, with_images).get(id)
+    if question is None:
+        raise APIException('Question not found', status_code=404)
+    return jsonify(serialize_thread(question, fields)), 200
+
 @app.route('/question', methods=['POST'])
 @jwt_required
 def add_question():
@@ -195,6 +318,8 @@ def add_question():
     description=request_body["description"], link=request_body["link"], created=now, last_update=now)
     question.save()
     DBManager.commitSession()
+    question_index.add(question)
+    response_cache.invalidate("questions")
     return jsonify({"status": "OK", "msg": "Question added", "question": question.serialize()}), 200
 
 @app.route('/question/<int:id>', methods=['PUT'])
@@ -213,22 +338,24 @@ def update_question(id):
     now = datetime.datetime.now()
     question.last_update = now
     db.session.commit() 
+    question_index.update(question)
+    response_cache.invalidate("questions", "question:{}".format(id))
     return jsonify("Question updated"), 200
 
 @app.route('/question/<int:id>', methods=['DELETE'])
 @jwt_required
 def delete_question(id):
-    question = Question.query.get(id)
-    if question is None:
+    released = stored_images(QuestionImages, QuestionImages.id_question == id) + stored_images(AnswerImages,
+        AnswerImages.id_answer.in_(db.session.query(Answer.id).filter(Answer.id_question == id).subquery()))
+    deleted = delete_question_cascade(id)
+    if deleted["questions"] == 0:
+        db.session.rollback()
         raise APIException('Question not found', status_code=404)
-
-    answers = Answer.query.filter_by(id_question=id).all()
-    for answer in answers:
-        db.session.delete(answer)
-
-    db.session.delete(question)
     db.session.commit() 
-    return jsonify("Question deleted"), 200
+    release_stored_images(released)
+    question_index.remove(id)
+    response_cache.invalidate("questions", "question:{}".format(id), "answers:{}".format(id))
+    return jsonify({"status": "OK", "msg": "Question deleted", "deleted": deleted}), 200
 
 @app.route('/mark-best-answer', methods=['PUT'])
 @jwt_required
@@ -241,40 +368,47 @@ def mark_best_answer():
     if answer is None:
         raise APIException('Answer not found', status_code=404)
     question.id_answer_selected = request_body["id_answer"]
+    question.last_update = datetime.datetime.now()
     db.session.commit() 
+    response_cache.invalidate("questions", "question:{}".format(question.id))
     return jsonify("Answer marked"), 200
 
 @app.route('/search-questions-by-string/<string:searchText>', methods=['GET'])
 @jwt_required
+@replica_router.read_only
 def get_search_questions_by_string(searchText):
-    words = searchText.split(' ')
-
-    filters = []
-    for word in words:
-        if len(word) >= 3:
-            word_like = "%{}%".format(word)
-            filters.append(Question.title.ilike(word_like))
-            filters.append(Question.description.ilike(word_like))
-    questions = Question.query.filter(or_(*filters)).all()
-    all_questions = list(map(lambda x: x.serialize(), questions))
-    for x in all_questions:
-        number = Answer.query.filter_by(id_question=x["id"]).count()
-        x["number_of_answers"] = number
-        user = User.query.filter_by(id=x["id_user"]).first()
-        x["user_name"] = user.name
-    return jsonify({"status": "OK", "msg": "Search result", "questions": all_questions}), 200
+    page = max(1, request.args.get('page', 1, type=int))
+    limit = page_args()[1]
+    if question_index.usable:
+        while True:
+            ids, next_page = question_index.search(searchText, page, limit)
+            rows = questions_listing_query(Question.id.in_(ids)).all()
+            deleted = set(ids) - set(row.id for row in rows)
+            if not deleted:
+                break
+            # deleted by another worker since the last sync, rank again without them
+            for id in deleted:
+                question_index.remove(id)
+        rows.sort(key=lambda row: ids.index(row.id))
+    else:
+        rows, next_page = search_questions(questions_listing_query(), searchText, page, limit)
+    all_questions = serialize_rows(rows)
+    return jsonify({"status": "OK", "msg": "Search result", "questions": all_questions, "next_page": next_page}), 200
 #endregion question_endpoints
 
 #region answer_endpoints
 @app.route('/answers', methods=['GET'])
 @jwt_required
+@replica_router.read_only
 def get_answers():
-    answers = Answer.query.all()
-    all_answers = list(map(lambda x: x.serialize(), answers))
-    for x in all_answers:
-        user = User.query.filter_by(id=x["id_user"]).first()
-        x["user_name"] = user.name
-    return jsonify(all_answers), 200
+    export = export_format()
+    if export:
+        return stream_export(answers_listing_query().order_by(Answer.created, Answer.id),
+            lambda x: x._asdict(), export)
+    cursor, limit = page_args()
+    answers, next_cursor = paginate(answers_listing_query(), Answer, cursor, limit)
+    all_answers = serialize_rows(answers)
+    return jsonify(all_answers), 200, page_headers(next_cursor)
 
 @app.route('/answer/<int:id>', methods=['GET'])
 @jwt_required
@@ -286,14 +420,12 @@ def get_answer(id):
 
 @app.route('/answers-by-question-id/<int:id>', methods=['GET'])
 @jwt_required
+@replica_router.read_only
+@conditional(answers_validator)
+@response_cache.cached(lambda id: ["answers:{}".format(id), "users"])
 def answers_by_question_id(id):
-    answers  = Answer.query.filter_by(id_question=id).all() 
-    if answers is None:
-        raise APIException('User with the email ' + email + ' not found', status_code=404)
-    all_answers = list(map(lambda x: x.serialize(), answers))
-    for x in all_answers:
-        user = User.query.filter_by(id=x["id_user"]).first()
-        x["user_name"] = user.name
+    answers = answers_listing_query(Answer.id_question == id).all()
+    all_answers = serialize_rows(answers)
     return jsonify(all_answers), 200
 
 @app.route('/answer', methods=['POST'])
@@ -303,8 +435,10 @@ def add_answer():
     now = datetime.datetime.now()
     answer = Answer(id_question=request_body["id_question"], id_user=request_body["id_user"],  
     description=request_body["description"], link=request_body["link"], created=now, last_update=now)
-    answer.save()
-    DBManager.commitSession()
+    db.session.add(answer)
+    count_answer_added(answer.id_question, now)
+    db.session.commit()
+    response_cache.invalidate("questions", "answers:{}".format(answer.id_question))
     return jsonify({"status": "OK", "msg": "Answer added", "answer": answer.serialize()}), 200
     #return jsonify("Answer added"), 200
 
@@ -322,6 +456,7 @@ def update_answer(id):
     now = datetime.datetime.now()
     answer.last_update = now
     db.session.commit() 
+    response_cache.invalidate("answers:{}".format(answer.id_question))
     #return jsonify("Answer updated"), 200
     return jsonify({"status": "OK", "msg": "Updated added", "answer": answer.serialize()}), 200
 
@@ -334,10 +469,16 @@ def delete_answer(id):
     print(answer)
     if answer is None:
         raise APIException('Answer not found', status_code=404)
+    id_question = answer.id_question
+    released = stored_images(AnswerImages, AnswerImages.id_answer == id)
     db.session.delete(answer)
+    db.session.flush()
+    count_answer_removed(id_question)
     print("->deleted")
     db.session.commit() 
     print("->commit")
+    release_stored_images(released)
+    response_cache.invalidate("questions", "answers:{}".format(id_question))
     return jsonify("Answer deleted"), 200
 #endregion
 
@@ -345,9 +486,14 @@ def delete_answer(id):
 @app.route('/question-images', methods=['GET'])
 @jwt_required
 def get_question_images():
-    question_images = QuestionImages.query.all()
+    export = export_format()
+    if export:
+        return stream_export(QuestionImages.query.order_by(QuestionImages.created, QuestionImages.id),
+            lambda x: x.serialize(), export)
+    cursor, limit = page_args()
+    question_images, next_cursor = paginate(QuestionImages.query, QuestionImages, cursor, limit)
     all_question_images = list(map(lambda x: x.serialize(), question_images))
-    return jsonify(all_question_images), 200
+    return jsonify(all_question_images), 200, page_headers(next_cursor)
 
 @app.route('/question-images-by-question-id/<int:id>', methods=['GET'])
 @jwt_required
@@ -363,8 +509,10 @@ def add_question_image():
     now = datetime.datetime.now()
     question_image = QuestionImages(id_question=request_body["id_question"], url=request_body["url"],
     size=request_body["size"], created=now, last_update=now)
-    question_image.save()
-    DBManager.commitSession()   
+    db.session.add(question_image)
+    count_question_images(question_image.id_question, 1)
+    db.session.commit()
+    response_cache.invalidate("question:{}".format(question_image.id_question))
     return jsonify("Question Image added"), 200
 
 @app.route('/question-image/<int:id>', methods=['DELETE'])
@@ -373,25 +521,40 @@ def delete_question_image(id):
     question_image = QuestionImages.query.get(id)
     if question_image is None:
         raise APIException('QuestionImage not found', status_code=404)
+    id_question = question_image.id_question
+    released = stored_images(QuestionImages, QuestionImages.id == id)
     db.session.delete(question_image)
+    count_question_images(id_question, -1)
     db.session.commit() 
+    release_stored_images(released)
+    response_cache.invalidate("question:{}".format(id_question))
     return jsonify("QuestionImage deleted"), 200
 
 @app.route('/question-images-delete-by-question-id/<int:id>', methods=['DELETE'])
 @jwt_required
 def delete_question_image_by_question_id(id):
-    db.session.query(QuestionImages).filter(QuestionImages.id_question == id).delete(synchronize_session=False)
+    released = stored_images(QuestionImages, QuestionImages.id_question == id)
+    deleted = db.session.query(QuestionImages).filter(QuestionImages.id_question == id).delete(synchronize_session=False)
+    count_question_images(id, -deleted)
     db.session.commit()
+    release_stored_images(released)
+    response_cache.invalidate("question:{}".format(id))
     return jsonify("QuestionImages deleted"), 200
 #endregion
 
 #region answer_image_endpoints
+def invalidate_answer_images(id_answer):
+    # answer images are served inside the answers of their question
+    id_question = db.session.query(Answer.id_question).filter(Answer.id == id_answer).scalar()
+    response_cache.invalidate("answers:{}".format(id_question))
+
 @app.route('/answer-images', methods=['GET'])
 @jwt_required
 def get_answer_images():
-    answer_images = AnswerImages.query.all()
+    cursor, limit = page_args()
+    answer_images, next_cursor = paginate(AnswerImages.query, AnswerImages, cursor, limit)
     all_answer_images = list(map(lambda x: x.serialize(), answer_images))
-    return jsonify(all_answer_images), 200
+    return jsonify(all_answer_images), 200, page_headers(next_cursor)
 
 @app.route('/answer-images-by-answer-id/<int:id>', methods=['GET'])
 @jwt_required
@@ -409,6 +572,7 @@ def add_answer_image():
     size=request_body["size"], created=now, last_update=now)
     answer_image.save()
     DBManager.commitSession()
+    invalidate_answer_images(answer_image.id_answer)
     return jsonify("Answer Image added"), 200
 
 @app.route('/answer-image/<int:id>', methods=['DELETE'])
@@ -417,55 +581,267 @@ def delete_answer_image(id):
     answer_image = AnswerImages.query.get(id)
     if answer_image is None:
         raise APIException('AnswerImage not found', status_code=404)
+    id_answer = answer_image.id_answer
+    released = stored_images(AnswerImages, AnswerImages.id == id)
     db.session.delete(answer_image)
     db.session.commit() 
+    release_stored_images(released)
+    invalidate_answer_images(id_answer)
     return jsonify("AnswerImage deleted"), 200
 
 @app.route('/answer-images-delete-by-answer-id/<int:id>', methods=['DELETE'])
 @jwt_required
 def delete_answer_image_by_answer_id(id):
+    released = stored_images(AnswerImages, AnswerImages.id_answer == id)
     db.session.query(AnswerImages).filter(AnswerImages.id_answer == id).delete(synchronize_session=False)
     db.session.commit()
+    release_stored_images(released)
+    invalidate_answer_images(id)
     return jsonify("AnswerImages deleted"), 200
 #endregion
 
 #region upload_images
+IMAGE_TARGETS = {
+    "question": (Question, QuestionImages, "id_question"),
+    "answer": (Answer, AnswerImages, "id_answer")
+}
+UPLOAD_STAGING_PREFIX = os.environ.get('UPLOAD_STAGING_PREFIX', 'staging/uploads/')
+
+def count_images(target, parent_id, delta):
+    # only questions keep an image counter
+    if target == "question":
+        count_question_images(parent_id, delta)
+
+def invalidate_images(target, parent_id):
+    if target == "question":
+        response_cache.invalidate("question:{}".format(parent_id))
+    else:
+        invalidate_answer_images(parent_id)
+
+def store_uploaded_images(target, parent_id, files):
+    """
+    Objects are keyed by the sha256 of their content: images already stored are not uploaded again,
+    the new row points at the existing objects. Originals and resized variants of the new ones
+    go up in the same concurrent batch.
+    """
+    bucket_name = os.environ.get('S3_BUCKET_NAME')
+    now = datetime.datetime.now()
+    parent_model, image_model, parent_column = IMAGE_TARGETS[target]
+    images = []
+    results = [None] * len(files)
+    pending = []
+    for i, file in enumerate(files):
+        filename = file.filename
+        content_hash = hash_file(file)
+        stored = find_stored_image(content_hash)
+        if stored is not None:
+            images.append(image_model(url=stored.url, size=stored.size, width=stored.width, height=stored.height,
+                variants=stored.variants, content_hash=content_hash, created=now, last_update=now))
+            results[i] = {"filename": filename, "url": stored.url, "deduplicated": True}
+            continue
+        file.filename = content_key(content_hash, filename)
+        pending.append((i, filename, content_hash, file))
+
+    # objects the bucket already has but no row points at, checked concurrently like the uploads
+    heads = head_s3_objects(bucket_name, [file.filename for i, filename, content_hash, file in pending])
+    pending = [(i, filename, content_hash, file, head is None, process_image(file))
+        for (i, filename, content_hash, file), head in zip(pending, heads)]
+
+    uploads = []
+    for i, filename, content_hash, file, upload_original, info in pending:
+        if upload_original:
+            uploads.append(file)
+        uploads += [variant["file"] for variant in info["variants"]]
+    upload_results = iter(upload_files_to_s3(uploads, bucket_name))
+    for i, filename, content_hash, file, upload_original, info in pending:
+        if upload_original:
+            result = next(upload_results)
+        else:
+            result = {"url": s3_location(bucket_name) + file.filename, "deduplicated": True}
+        variants = uploaded_variants(info, [next(upload_results) for variant in info["variants"]])
+        results[i] = dict(result, filename=filename)
+        if "url" in result:
+            images.append(image_model(url=result["url"], size=info["size"], width=info["width"],
+                height=info["height"], variants=json.dumps(variants), content_hash=content_hash,
+                created=now, last_update=now))
+
+    for image in images:
+        setattr(image, parent_column, parent_id)
+    if images:
+        db.session.add_all(images)
+        count_images(target, parent_id, len(images))
+        db.session.commit()
+        invalidate_images(target, parent_id)
+    return results
+
+def upload_response(results):
+    uploaded = [x for x in results if "url" in x]
+    status = "OK" if len(uploaded) == len(results) else "KO"
+    status_code = 200 if uploaded or not results else 502
+    return jsonify({"status": status, "msg": "{} of {} images uploaded".format(len(uploaded), len(results)),
+        "files": results}), status_code
+
+def queue_uploaded_images(target, parent_id, files):
+    # staged in the bucket, not on local disk: the worker runs on another dyno with its own filesystem
+    bucket_name = os.environ.get('S3_BUCKET_NAME')
+    staged = []
+    for file in files:
+        key = "{}{}-{}".format(UPLOAD_STAGING_PREFIX, uuid.uuid4().hex, secure_filename(file.filename) or "image")
+        staged.append({"key": key, "filename": file.filename, "content_type": file.content_type})
+        file.filename = key
+    results = upload_files_to_s3(files, bucket_name, acl="private")
+    if any("url" not in x for x in results):
+        delete_s3_objects(bucket_name, [x["key"] for x, result in zip(staged, results) if "url" in result])
+        raise APIException('Images could not be staged for upload', status_code=502)
+    job = enqueue("upload_images", {"target": target, "id": parent_id, "files": staged})
+    return jsonify({"status": "OK", "msg": "Upload queued", "job": job.serialize()}), 202
+
+def delete_staged_images(payload):
+    delete_s3_objects(os.environ.get('S3_BUCKET_NAME'), [x["key"] for x in payload["files"]])
+
+@task("upload_images", on_failed=delete_staged_images)
+def upload_images_task(payload):
+    bucket_name = os.environ.get('S3_BUCKET_NAME')
+    staged = payload["files"]
+    files = [FileStorage(stream=io.BytesIO(download_s3_object(bucket_name, x["key"])), filename=x["filename"],
+        content_type=x["content_type"]) for x in staged]
+    results = store_uploaded_images(payload["target"], payload["id"], files)
+    delete_s3_objects(bucket_name, [x["key"] for x, result in zip(staged, results) if "url" in result])
+    failed = [x for x, result in zip(staged, results) if "url" not in result]
+    if failed:
+        raise JobRetry("{} of {} uploads failed".format(len(failed), len(staged)), dict(payload, files=failed))
+    return results
+
+@task("image_variants")
+def image_variants_task(payload):
+    # images uploaded straight to S3 get their variants here
+    parent_model, image_model, parent_column = IMAGE_TARGETS[payload["target"]]
+    image = image_model.query.get(payload["id"])
+    if image is None:
+        return None
+    bucket_name = os.environ.get('S3_BUCKET_NAME')
+    file = FileStorage(stream=io.BytesIO(download_s3_object(bucket_name, payload["key"])), filename=payload["key"])
+    content_hash = hash_file(file)
+    stored = find_stored_image(content_hash)
+    if stored is not None:
+        # same content already stored: share its objects and drop the direct upload
+        image.url, image.variants = stored.url, stored.variants
+        image.width, image.height, image.content_hash = stored.width, stored.height, content_hash
+        image.last_update = datetime.datetime.now()
+        db.session.commit()
+        # the match may be a row of this same upload (a retried complete), keep objects still referenced
+        if url_references(s3_location(bucket_name) + payload["key"]) == 0:
+            delete_s3_object(bucket_name, payload["key"])
+        invalidate_images(payload["target"], getattr(image, parent_column))
+        return image.serialize()["variants"]
+    info = process_image(file)
+    results = upload_files_to_s3([variant["file"] for variant in info["variants"]], bucket_name)
+    image.width = info["width"]
+    image.height = info["height"]
+    image.variants = json.dumps(uploaded_variants(info, results))
+    image.content_hash = content_hash
+    image.last_update = datetime.datetime.now()
+    db.session.commit()
+    invalidate_images(payload["target"], getattr(image, parent_column))
+    return image.serialize()["variants"]
+
 @app.route('/upload-question-images', methods=['POST'])
 #@jwt_required
 def upload_question_images():
-    print("upload_question_images")
-    files = request.files
-    print(files)
+    files = [request.files[key] for key in request.files if request.files[key]]
     id_question = request.form.get('id_question')
-    for key in files:
-        print(key)
-        file = files[key]
-        if file:
-            print(file)
-            url_image = upload_file_to_s3(file, os.environ.get('S3_BUCKET_NAME'))
-            print(url_image)
-            now = datetime.datetime.now()
-            question_image = QuestionImages(id_question=id_question, url=url_image, 
-            size=0, created=now, last_update=now)
-            question_image.save()
-            DBManager.commitSession()
-    return jsonify("OK"), 200
+    if request.args.get('async') == 'true':
+        return queue_uploaded_images("question", id_question, files)
+    return upload_response(store_uploaded_images("question", id_question, files))
 
 @app.route('/upload-answer-images', methods=['POST'])
 #@jwt_required
 def upload_answer_images():
-    files = request.files
+    files = [request.files[key] for key in request.files if request.files[key]]
     id_answer = request.form.get('id_answer')
-    for key in files:
-        file = files[key]
-        if file:
-            url_image = upload_file_to_s3(file, os.environ.get('S3_BUCKET_NAME'))
-            now = datetime.datetime.now()
-            answer_image = AnswerImages(id_answer=id_answer, url=url_image, 
-            size=0, created=now, last_update=now)
-            answer_image.save()
-            DBManager.commitSession()
-    return jsonify("OK"), 200
+    if request.args.get('async') == 'true':
+        return queue_uploaded_images("answer", id_answer, files)
+    return upload_response(store_uploaded_images("answer", id_answer, files))
+
+@app.route('/image-exists/<string:content_hash>', methods=['GET'])
+@jwt_required
+def image_exists(content_hash):
+    # lets clients skip sending bytes the bucket already has
+    stored = find_stored_image(content_hash.lower())
+    return jsonify({"exists": stored is not None, "url": stored.url if stored else None}), 200
+
+# direct uploads: the client asks for a presigned request, sends the bytes to S3, then calls complete
+def image_target(request_body):
+    target = request_body.get("target")
+    if target not in IMAGE_TARGETS:
+        raise APIException('target must be question or answer', status_code=400)
+    parent = IMAGE_TARGETS[target][0].query.get(request_body.get("id"))
+    if parent is None:
+        raise APIException(target.capitalize() + ' not found', status_code=404)
+    return target, parent
+
+@app.route('/presigned-image-upload', methods=['POST'])
+@jwt_required
+def presigned_upload():
+    request_body = request.get_json()
+    target, parent = image_target(request_body)
+    if request_body.get("sha256") and find_stored_image(request_body["sha256"].lower()) is not None:
+        # nothing to send, complete the upload with the same sha256
+        return jsonify({"status": "OK", "exists": True}), 200
+    content_type = request_body.get("content_type")
+    if content_type not in IMAGE_CONTENT_TYPES:
+        raise APIException('Unsupported content type', status_code=400)
+    size = request_body.get("size")
+    if not isinstance(size, int) or size <= 0 or size > MAX_IMAGE_SIZE:
+        raise APIException('size must be between 1 and ' + str(MAX_IMAGE_SIZE) + ' bytes', status_code=400)
+    filename = secure_filename(request_body.get("filename", "")) or "image"
+    key = "{}s/{}/{}/{}".format(target, parent.id, uuid.uuid4().hex, filename)
+    upload = presigned_image_upload(os.environ.get('S3_BUCKET_NAME'), key, content_type, size,
+        request_body.get("method", "post"))
+    return jsonify({"status": "OK", "exists": False, "key": key, "upload": upload}), 200
+
+@app.route('/presigned-image-upload/complete', methods=['POST'])
+@jwt_required
+def complete_presigned_upload():
+    request_body = request.get_json()
+    target, parent = image_target(request_body)
+    parent_model, image_model, parent_column = IMAGE_TARGETS[target]
+    now = datetime.datetime.now()
+    if request_body.get("sha256") and not request_body.get("key"):
+        stored = find_stored_image(request_body["sha256"].lower())
+        if stored is None:
+            raise APIException('Image not found', status_code=404)
+        image = image_model(url=stored.url, size=stored.size, width=stored.width, height=stored.height,
+            variants=stored.variants, content_hash=stored.content_hash, created=now, last_update=now)
+        setattr(image, parent_column, parent.id)
+        db.session.add(image)
+        count_images(target, parent.id, 1)
+        db.session.commit()
+        invalidate_images(target, parent.id)
+        return jsonify({"status": "OK", "msg": "Image added", "image": image.serialize()}), 200
+    key = request_body.get("key", "")
+    if not key.startswith("{}s/{}/".format(target, parent.id)):
+        raise APIException('key does not belong to this ' + target, status_code=400)
+    bucket_name = os.environ.get('S3_BUCKET_NAME')
+    existing = image_model.query.filter(image_model.url == s3_location(bucket_name) + key).first()
+    if existing is not None:
+        # a retried complete: the row, its counter and its variants job already exist
+        return jsonify({"status": "OK", "msg": "Image already added", "image": existing.serialize()}), 200
+    s3_object = head_s3_object(bucket_name, key)
+    if s3_object is None:
+        raise APIException('Uploaded image not found', status_code=404)
+    size = s3_object["ContentLength"]
+    if size > MAX_IMAGE_SIZE or s3_object.get("ContentType") not in IMAGE_CONTENT_TYPES:
+        delete_s3_object(bucket_name, key)
+        raise APIException('Uploaded image rejected', status_code=400)
+    image = image_model(url=s3_location(bucket_name) + key, size=size, created=now, last_update=now)
+    setattr(image, parent_column, parent.id)
+    db.session.add(image)
+    count_images(target, parent.id, 1)
+    db.session.commit()
+    invalidate_images(target, parent.id)
+    enqueue("image_variants", {"target": target, "id": image.id, "key": key})
+    return jsonify({"status": "OK", "msg": "Image added", "image": image.serialize()}), 200
 #endregion
 
 # this only runs if `$ python src/main.py` is executed
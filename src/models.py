@@ -1,8 +1,9 @@
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import backref
+import json
+from sqlalchemy.orm import backref, joinedload, selectinload
 from helpers import ModelHelper
+from db_routing import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 class Role(db.Model, ModelHelper):
     id = db.Column(db.Integer, primary_key=True)
@@ -23,11 +24,14 @@ class Role(db.Model, ModelHelper):
         }        
 
 class User(db.Model, ModelHelper):
+    __table_args__ = (
+        db.Index('ix_user_created_id', 'created', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=False, nullable=False)
     email = db.Column(db.String(255), unique=True, nullable=False)
     password = db.Column(db.String(80), unique=False, nullable=False)
-    id_role = db.Column(db.Integer, db.ForeignKey("role.id"))
+    id_role = db.Column(db.Integer, db.ForeignKey("role.id"), index=True)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False, default=True)
     alerts_activated = db.Column(db.Boolean(), unique=False, nullable=False, default=True)
     created = db.Column(db.DateTime(), unique=False, nullable=False)
@@ -50,8 +54,11 @@ class User(db.Model, ModelHelper):
         }
 
 class Question(db.Model, ModelHelper):
+    __table_args__ = (
+        db.Index('ix_question_created_id', 'created', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    id_user = db.Column(db.Integer, db.ForeignKey("user.id"))
+    id_user = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
     title = db.Column(db.String(100), unique=False, nullable=False)
     description = db.Column(db.String(5000), unique=False, nullable=False)
     link = db.Column(db.String(255), unique=False, nullable=True)
@@ -59,11 +66,15 @@ class Question(db.Model, ModelHelper):
     last_update = db.Column(db.DateTime(), unique=False, nullable=False)
     user = db.relationship('User', foreign_keys=[id_user])
     
-    id_answer_selected = db.Column(db.Integer, db.ForeignKey("answer.id"), default=None)
+    id_answer_selected = db.Column(db.Integer, db.ForeignKey("answer.id", name="fk_question_id_answer_selected", ondelete="SET NULL"), default=None, index=True)
     answer_selected = db.relationship("Answer", foreign_keys=[id_answer_selected])
 
     
     answer = db.relationship('Answer', foreign_keys="Answer.id_question")
+    # maintained by the endpoints that add or remove answers and images, rebuilt by `flask recount`
+    answer_count = db.Column(db.Integer, unique=False, nullable=False, default=0, server_default="0")
+    last_answer_at = db.Column(db.DateTime(), unique=False, nullable=True)
+    image_count = db.Column(db.Integer, unique=False, nullable=False, default=0, server_default="0")
     foo  = db.Column(db.String(255), unique=False, nullable=True)
     def __repr__(self):
         return '<id %r>' % self.id
@@ -80,19 +91,42 @@ class Question(db.Model, ModelHelper):
             "last_update": self.last_update
         }
 
+    # the columns serialize() reads, for listings that build the dicts straight from rows
+    @staticmethod
+    def serialize_columns():
+        return [Question.id, Question.id_user, Question.title, Question.description, Question.link,
+            Question.id_answer_selected, Question.created, Question.last_update]
+
     def serialize_with_user(self):
         question = self.serialize()
         question["user"] = self.user.serialize()
         return(question)
 
+    # eager loading options, so serializers touching relationships don't lazy load per row
+    @staticmethod
+    def load_user():
+        return joinedload(Question.user)
+
+    @staticmethod
+    def load_answers():
+        return selectinload(Question.answer).joinedload(Answer.user)
+
+    @staticmethod
+    def load_images():
+        return selectinload(Question.question)
+
     def delete_answers(self):
         for answer in self.answers:
             db.session.delete(answer)
 
 
 class Answer(db.Model, ModelHelper):
+    __table_args__ = (
+        db.Index('ix_answer_id_question_created', 'id_question', 'created'),
+        db.Index('ix_answer_created_id', 'created', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    id_user = db.Column(db.Integer, db.ForeignKey("user.id"))
+    id_user = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
     description = db.Column(db.String(5000), unique=False, nullable=False)
     link = db.Column(db.String(255), unique=False, nullable=True)
     created = db.Column(db.DateTime(), unique=False, nullable=False)
@@ -100,7 +134,7 @@ class Answer(db.Model, ModelHelper):
     user = db.relationship("User", foreign_keys=[id_user])
     foo  = db.Column(db.String(255), unique=False, nullable=True)
     # many to many
-    id_question = db.Column(db.Integer, db.ForeignKey("question.id", use_alter=True))
+    id_question = db.Column(db.Integer, db.ForeignKey("question.id", use_alter=True, name="fk_answer_id_question", ondelete="CASCADE"))
     question = db.relationship("Question", foreign_keys=[id_question])
     #id_question = db.relationship("Question", unique=False, foreign_keys="Question.id_answer_selected")
 
@@ -119,11 +153,28 @@ class Answer(db.Model, ModelHelper):
             "user_name": ""
         }
 
+    @staticmethod
+    def serialize_columns():
+        return [Answer.id, Answer.id_question, Answer.id_user, Answer.description, Answer.link,
+            Answer.created, Answer.last_update]
+
+    def serialize_with_user_name(self):
+        answer = self.serialize()
+        answer["user_name"] = self.user.name if self.user else ""
+        return answer
+
 class QuestionImages(db.Model, ModelHelper):
+    __table_args__ = (
+        db.Index('ix_question_images_created_id', 'created', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    id_question = db.Column(db.Integer, db.ForeignKey("question.id"))
+    id_question = db.Column(db.Integer, db.ForeignKey("question.id", name="fk_question_images_id_question", ondelete="CASCADE"), index=True)
     url = db.Column(db.String(255), unique=False, nullable=False)
     size = db.Column(db.Integer, unique=False, nullable=True)
+    width = db.Column(db.Integer, unique=False, nullable=True)
+    height = db.Column(db.Integer, unique=False, nullable=True)
+    variants = db.Column(db.Text(), unique=False, nullable=True)
+    content_hash = db.Column(db.String(64), unique=False, nullable=True, index=True)
     created = db.Column(db.DateTime(), unique=False, nullable=False)
     last_update = db.Column(db.DateTime(), unique=False, nullable=False)
     question = db.relationship(Question, backref=backref("question", cascade="all,delete"))
@@ -137,15 +188,26 @@ class QuestionImages(db.Model, ModelHelper):
             "id_question": self.id_question,
             "url": self.url,
             "size": self.size,
+            "width": self.width,
+            "height": self.height,
+            "variants": json.loads(self.variants) if self.variants else {},
+            "content_hash": self.content_hash,
             "created": self.created,
             "last_update": self.last_update
         }
 
 class AnswerImages(db.Model, ModelHelper):
+    __table_args__ = (
+        db.Index('ix_answer_images_created_id', 'created', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    id_answer = db.Column(db.Integer, db.ForeignKey("answer.id"))
+    id_answer = db.Column(db.Integer, db.ForeignKey("answer.id", name="fk_answer_images_id_answer", ondelete="CASCADE"), index=True)
     url = db.Column(db.String(255), unique=False, nullable=False)
     size = db.Column(db.Integer, unique=False, nullable=True)
+    width = db.Column(db.Integer, unique=False, nullable=True)
+    height = db.Column(db.Integer, unique=False, nullable=True)
+    variants = db.Column(db.Text(), unique=False, nullable=True)
+    content_hash = db.Column(db.String(64), unique=False, nullable=True, index=True)
     created = db.Column(db.DateTime(), unique=False, nullable=False)
     last_update = db.Column(db.DateTime(), unique=False, nullable=False)
     answer = db.relationship(Answer, backref=backref("answer", cascade="all,delete"))
@@ -159,6 +221,42 @@ class AnswerImages(db.Model, ModelHelper):
             "id_answer": self.id_answer,
             "url": self.url,
             "size": self.size,
+            "width": self.width,
+            "height": self.height,
+            "variants": json.loads(self.variants) if self.variants else {},
+            "content_hash": self.content_hash,
+            "created": self.created,
+            "last_update": self.last_update
+        }
+class Job(db.Model, ModelHelper):
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), unique=False, nullable=False)
+    payload = db.Column(db.Text(), unique=False, nullable=False)
+    status = db.Column(db.String(20), unique=False, nullable=False, default="queued")
+    attempts = db.Column(db.Integer, unique=False, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, unique=False, nullable=False, default=5)
+    run_at = db.Column(db.DateTime(), unique=False, nullable=False)
+    worker = db.Column(db.String(80), unique=False, nullable=True)
+    result = db.Column(db.Text(), unique=False, nullable=True)
+    last_error = db.Column(db.String(1000), unique=False, nullable=True)
+    created = db.Column(db.DateTime(), unique=False, nullable=False)
+    last_update = db.Column(db.DateTime(), unique=False, nullable=False)
+    def __repr__(self):
+        return '<Job %r>' % self.id
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "run_at": self.run_at,
+            "result": json.loads(self.result) if self.result else None,
+            "last_error": self.last_error,
             "created": self.created,
             "last_update": self.last_update
-        }
\ No newline at end of file
+        }
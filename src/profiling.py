@@ -0,0 +1,181 @@
+import os, time, random, cProfile, threading
+from flask import g, request, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+METRIC_PREFIX = "questioner_"
+
+class Histogram():
+    """
+    Cumulative histogram per label set, in the Prometheus bucket layout.
+    """
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.setdefault(labels, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["buckets"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        for labels, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series["buckets"]):
+                lines.append("{}_bucket{} {}".format(self.name, format_labels(labels + (("le", str(bound)),)), count))
+            lines.append("{}_bucket{} {}".format(self.name, format_labels(labels + (("le", "+Inf"),)), series["count"]))
+            lines.append("{}_sum{} {}".format(self.name, format_labels(labels), series["sum"]))
+            lines.append("{}_count{} {}".format(self.name, format_labels(labels), series["count"]))
+        return lines
+
+class Counter():
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.series = {}
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} counter".format(self.name)]
+        for labels, value in sorted(self.series.items()):
+            lines.append("{}{} {}".format(self.name, format_labels(labels), value))
+        return lines
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, escape_label(value)) for name, value in labels) + "}"
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def redact(statement, parameters):
+    """
+    The statement keeps its placeholders, the values are replaced by their types
+    so user data (emails, passwords, descriptions) never reaches the log.
+    """
+    return "{} -- params: {}".format(" ".join(statement.split()), parameter_types(parameters))
+
+def parameter_types(parameters):
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany
+            return "{} x {}".format(len(parameters), parameter_types(parameters[0]))
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+class Profiler():
+    """
+    Request profiling: latency histograms per endpoint, DB query count and time per request,
+    slow query logging and sampled cProfile dumps. Metrics are kept per worker process.
+    """
+    def __init__(self, slow_query_ms=500, profile_sample_rate=0.0, profile_dir="/tmp/questioner-profiles"):
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_dir = profile_dir
+        self.lock = threading.Lock()
+        self.request_duration = Histogram(METRIC_PREFIX + "request_duration_seconds",
+            "Request latency by endpoint", LATENCY_BUCKETS)
+        self.requests = Counter(METRIC_PREFIX + "requests_total", "Requests by endpoint and status")
+        self.request_queries = Histogram(METRIC_PREFIX + "request_db_queries",
+            "DB queries per request by endpoint", QUERY_COUNT_BUCKETS)
+        self.request_db_duration = Histogram(METRIC_PREFIX + "request_db_duration_seconds",
+            "DB time per request by endpoint", LATENCY_BUCKETS)
+        self.queries = Counter(METRIC_PREFIX + "db_queries_total", "DB queries, inside and outside requests")
+        self.slow_queries = Counter(METRIC_PREFIX + "db_slow_queries_total",
+            "DB queries slower than SLOW_QUERY_MS")
+
+    @classmethod
+    def from_env(cls):
+        return cls(int(os.environ.get('SLOW_QUERY_MS', 500)),
+            float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+            os.environ.get('PROFILE_DIR', '/tmp/questioner-profiles'))
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        slow = elapsed >= self.slow_query_seconds
+        with self.lock:
+            self.queries.inc(())
+            if slow:
+                self.slow_queries.inc(())
+        if slow:
+            print("Slow query ({:.0f} ms): {}".format(elapsed * 1000, redact(statement, parameters)))
+        if has_app_context() and "profile_start" in g:
+            g.profile_queries += 1
+            g.profile_db_seconds += elapsed
+
+    def handle_error(self, context):
+        # failed statements never reach after_cursor_execute
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+
+    def start_request(self):
+        g.profile_start = time.perf_counter()
+        g.profile_queries = 0
+        g.profile_db_seconds = 0.0
+        g.profile = None
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate:
+            g.profile = cProfile.Profile()
+            try:
+                g.profile.enable()
+            except ValueError:
+                # another request of this process is being profiled already
+                g.profile = None
+
+    def finish_request(self, response):
+        if "profile_start" not in g:
+            return response
+        elapsed = time.perf_counter() - g.profile_start
+        endpoint = request.endpoint or "unmatched"
+        if g.profile is not None:
+            g.profile.disable()
+            self.dump_profile(g.profile, endpoint)
+        labels = (("endpoint", endpoint), ("method", request.method))
+        with self.lock:
+            self.request_duration.observe(labels, elapsed)
+            self.requests.inc(labels + (("status", str(response.status_code)),))
+            self.request_queries.observe(labels, g.profile_queries)
+            self.request_db_duration.observe(labels, g.profile_db_seconds)
+        response.headers["Server-Timing"] = "db;dur={:.1f};desc=\"{} queries\", app;dur={:.1f}".format(
+            g.profile_db_seconds * 1000, g.profile_queries, elapsed * 1000)
+        return response
+
+    def dump_profile(self, profile, endpoint):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profile.dump_stats(os.path.join(self.profile_dir, "{}-{}-{}.prof".format(
+                endpoint, int(time.time() * 1000), os.getpid())))
+        except OSError as e:
+            print("Profile not saved: ", e)
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for metric in (self.request_duration, self.requests, self.request_queries,
+                    self.request_db_duration, self.queries, self.slow_queries):
+                lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def init_app(self, app):
+        # listening on Engine covers the primary and every replica engine
+        event.listen(Engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(Engine, "handle_error", self.handle_error)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+profiler = Profiler.from_env()
@@ -0,0 +1,121 @@
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from models import db, User, Question, Answer, QuestionImages, AnswerImages
+
+def questions_listing_query(*filters):
+    # questions with number_of_answers and user_name resolved in a single statement,
+    # selected as plain columns so the listing never builds ORM objects
+    query = db.session.query(
+        *Question.serialize_columns(),
+        Question.answer_count.label("number_of_answers"),
+        User.name.label("user_name")
+    ).outerjoin(User, User.id == Question.id_user)
+    if filters:
+        query = query.filter(*filters)
+    return query
+
+def answers_listing_query(*filters):
+    query = db.session.query(
+        *Answer.serialize_columns(),
+        func.coalesce(User.name, "").label("user_name")
+    ).outerjoin(User, User.id == Answer.id_user)
+    if filters:
+        query = query.filter(*filters)
+    return query
+
+def serialize_rows(rows):
+    # rows of a column query already hold the serialize() keys as their labels
+    return [row._asdict() for row in rows]
+
+def thread_query(with_answers=True, with_images=True):
+    # question, answers and images in a fixed number of batched queries
+    options = [Question.load_user()]
+    if with_answers:
+        options.append(Question.load_answers())
+        if with_images:
+            options.append(selectinload(Question.answer).selectinload(Answer.answer))
+    if with_images:
+        options.append(Question.load_images())
+    return Question.query.options(*options)
+
+def select_fields(item, fields):
+    if fields is None:
+        return item
+    return {key: value for key, value in item.items() if key in fields}
+
+def serialize_thread(question, fields=None):
+    with_answers = fields is None or "answers" in fields
+    with_images = fields is None or "images" in fields
+    thread = question.serialize()
+    thread["user_name"] = question.user.name if question.user else ""
+    if with_images:
+        thread["images"] = [select_fields(x.serialize(), fields) for x in question.question]
+    if with_answers:
+        thread["number_of_answers"] = len(question.answer)
+        answers = []
+        for answer in sorted(question.answer, key=lambda x: (x.created, x.id)):
+            x = answer.serialize_with_user_name()
+            if with_images:
+                x["images"] = [select_fields(y.serialize(), fields) for y in answer.answer]
+            answers.append(select_fields(x, fields))
+        thread["answers"] = answers
+    return select_fields(thread, fields)
+
+# counter updates run in the caller's transaction, next to the insert or delete they account for
+
+def count_answer_added(id_question, created):
+    Question.query.filter(Question.id == id_question).update({
+        Question.answer_count: Question.answer_count + 1,
+        Question.last_answer_at: created
+    }, synchronize_session=False)
+
+def count_answer_removed(id_question):
+    # call after the delete is flushed, last_answer_at is read back from the remaining answers
+    last_answer_at = db.session.query(func.max(Answer.created)).filter(Answer.id_question == id_question).as_scalar()
+    Question.query.filter(Question.id == id_question).update({
+        Question.answer_count: Question.answer_count - 1,
+        Question.last_answer_at: last_answer_at
+    }, synchronize_session=False)
+
+def count_question_images(id_question, delta):
+    Question.query.filter(Question.id == id_question).update({
+        Question.image_count: Question.image_count + delta
+    }, synchronize_session=False)
+
+def recount_questions(batch_size=1000):
+    """
+    Rebuilds answer_count, last_answer_at and image_count from the answer and image tables,
+    one UPDATE and commit per batch_size question ids. Returns the number of questions updated.
+    """
+    answer_count = db.session.query(func.count(Answer.id)).filter(Answer.id_question == Question.id).as_scalar()
+    last_answer_at = db.session.query(func.max(Answer.created)).filter(Answer.id_question == Question.id).as_scalar()
+    image_count = db.session.query(func.count(QuestionImages.id)).filter(
+        QuestionImages.id_question == Question.id).as_scalar()
+    last_id = db.session.query(func.max(Question.id)).scalar() or 0
+    updated = 0
+    for start in range(0, last_id, batch_size):
+        updated += Question.query.filter(Question.id > start, Question.id <= start + batch_size).update({
+            Question.answer_count: answer_count,
+            Question.last_answer_at: last_answer_at,
+            Question.image_count: image_count
+        }, synchronize_session=False)
+        db.session.commit()
+    return updated
+
+def delete_question_cascade(id):
+    """
+    Deletes a question with its answers and images using set based DELETE statements,
+    nothing is loaded into the session. The caller commits. Returns the removed row counts.
+    """
+    answer_ids = db.session.query(Answer.id).filter(Answer.id_question == id)
+    # the selected answer is about to be deleted
+    Question.query.filter(Question.id == id).update(
+        {Question.id_answer_selected: None}, synchronize_session=False)
+    deleted = {}
+    deleted["answer_images"] = AnswerImages.query.filter(
+        AnswerImages.id_answer.in_(answer_ids.subquery())).delete(synchronize_session=False)
+    deleted["answers"] = Answer.query.filter(Answer.id_question == id).delete(synchronize_session=False)
+    deleted["question_images"] = QuestionImages.query.filter(
+        QuestionImages.id_question == id).delete(synchronize_session=False)
+    deleted["questions"] = Question.query.filter(Question.id == id).delete(synchronize_session=False)
+    return deleted
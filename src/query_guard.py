@@ -0,0 +1,171 @@
+"""
+N+1 query detection. QueryGuard counts the statements run by the current thread and reports
+the repeated ones, use it as a context manager or a decorator:
+
+    with QueryGuard(budget=2):
+        client.get('/questions')
+
+init_app checks every request against ENDPOINT_QUERY_BUDGETS when QUERY_GUARD is warn or raise.
+Tests get the same checks through the fixtures below, with pytest_plugins = ["query_guard"] in conftest.py.
+"""
+import os, re, threading, warnings
+from collections import Counter
+from functools import wraps
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# queries per request, conditional validators and pagination included.
+# selectinload batches 500 ids per query, so threads with long answer lists take a few more
+ENDPOINT_QUERY_BUDGETS = {
+    "get_questions": 2,
+    "get_question": 2,
+    "get_thread": 8,
+    "get_search_questions_by_string": 2,
+    "get_answers": 1,
+    "answers_by_question_id": 2,
+    "get_roles": 2,
+    "login": 1
+}
+QUERY_GUARD_MODES = ("off", "warn", "raise")
+QUERY_GUARD_DEFAULT_BUDGET = int(os.environ.get('QUERY_GUARD_DEFAULT_BUDGET', 20))
+# a statement run this many times in one guard is reported as a likely N+1 loop
+QUERY_GUARD_REPEAT_THRESHOLD = int(os.environ.get('QUERY_GUARD_REPEAT_THRESHOLD', 3))
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+class QueryBudgetWarning(UserWarning):
+    pass
+
+active = threading.local()
+
+def normalize(statement):
+    """
+    Statement pattern: literals and IN lists collapsed so the queries of a loop share one pattern.
+    """
+    statement = " ".join(statement.split())
+    statement = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    statement = re.sub(r"\b\d+\b", "?", statement)
+    statement = re.sub(r"\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,?)+\)", "(?)", statement)
+    return statement
+
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    for guard in getattr(active, "guards", ()):
+        guard.statements.append(statement)
+
+event.listen(Engine, "before_cursor_execute", record_statement)
+
+class QueryGuard():
+    def __init__(self, budget=None, name=None, mode="raise", repeat_threshold=QUERY_GUARD_REPEAT_THRESHOLD):
+        if mode not in QUERY_GUARD_MODES:
+            raise ValueError("Unknown query guard mode " + mode)
+        self.budget = budget
+        self.name = name
+        self.mode = mode
+        self.repeat_threshold = repeat_threshold
+        self.statements = []
+
+    def __enter__(self):
+        self.statements = []
+        if not hasattr(active, "guards"):
+            active.guards = []
+        active.guards.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        active.guards.remove(self)
+        if exc_type is None:
+            self.check()
+        return False
+
+    def __call__(self, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with QueryGuard(self.budget, self.name or fn.__name__, self.mode, self.repeat_threshold):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self):
+        """
+        [(pattern, times)] of the statement patterns run at least repeat_threshold times, most repeated first.
+        """
+        patterns = Counter(normalize(statement) for statement in self.statements)
+        return [(pattern, times) for pattern, times in patterns.most_common() if times >= self.repeat_threshold]
+
+    def report(self):
+        lines = ["{} ran {} queries, budget {}".format(self.name or "block", self.count, self.budget)]
+        for pattern, times in self.repeated():
+            lines.append("  {}x {}".format(times, pattern))
+        return "\n".join(lines)
+
+    def check(self):
+        if self.mode == "off" or self.budget is None or self.count <= self.budget:
+            return
+        if self.mode == "warn":
+            warnings.warn(self.report(), QueryBudgetWarning, stacklevel=3)
+            print(self.report())
+        else:
+            raise QueryBudgetExceeded(self.report())
+
+def endpoint_budget(endpoint):
+    return ENDPOINT_QUERY_BUDGETS.get(endpoint, QUERY_GUARD_DEFAULT_BUDGET)
+
+def init_app(app, mode=None):
+    mode = mode or os.environ.get('QUERY_GUARD', 'off')
+    if mode not in QUERY_GUARD_MODES:
+        raise ValueError("Unknown query guard mode " + mode)
+    app.config['QUERY_GUARD'] = mode
+
+    @app.before_request
+    def start_query_guard():
+        if app.config['QUERY_GUARD'] != "off":
+            g.query_guard = QueryGuard(endpoint_budget(request.endpoint), request.endpoint,
+                app.config['QUERY_GUARD']).__enter__()
+
+    @app.after_request
+    def check_query_guard(response):
+        guard = g.pop('query_guard', None)
+        if guard is not None:
+            response.headers["X-Query-Count"] = str(guard.count)
+            guard.__exit__(None, None, None)
+        return response
+
+    @app.teardown_request
+    def remove_query_guard(exception):
+        # after_request is skipped when the response fails, don't leave the guard counting
+        guard = g.pop('query_guard', None)
+        if guard is not None and guard in getattr(active, "guards", ()):
+            active.guards.remove(guard)
+
+try:
+    import pytest
+except ImportError:
+    pytest = None
+
+if pytest is not None:
+    @pytest.fixture
+    def query_guard():
+        """
+        QueryGuard factory for tests: with query_guard(budget=2): client.get('/questions')
+        """
+        return QueryGuard
+
+    @pytest.fixture
+    def query_budgets():
+        """
+        Fails any request of the test that runs more queries than its endpoint budget.
+        """
+        from main import app
+        config = {key: app.config.get(key) for key in ('QUERY_GUARD', 'PROPAGATE_EXCEPTIONS')}
+        budgets = dict(ENDPOINT_QUERY_BUDGETS)
+        # let QueryBudgetExceeded reach the test instead of turning into a 500
+        app.config.update(QUERY_GUARD="raise", PROPAGATE_EXCEPTIONS=True)
+        yield ENDPOINT_QUERY_BUDGETS
+        app.config.update(config)
+        ENDPOINT_QUERY_BUDGETS.clear()
+        ENDPOINT_QUERY_BUDGETS.update(budgets)
@@ -0,0 +1,39 @@
+from sqlalchemy import inspect
+from models import db
+from search import FULLTEXT_INDEX_NAME
+
+# indexes created by migrations that can not be declared on the models
+UNDECLARED_INDEXES = {FULLTEXT_INDEX_NAME}
+
+def declared_indexes():
+    indexes = {}
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            indexes[(table.name, index.name)] = tuple(column.name for column in index.columns)
+    return indexes
+
+def live_indexes(engine):
+    inspector = inspect(engine)
+    indexes = {}
+    for table_name in inspector.get_table_names():
+        for index in inspector.get_indexes(table_name):
+            indexes[(table_name, index['name'])] = tuple(index['column_names'])
+    return indexes
+
+def index_drift(engine):
+    """
+    Compares the indexes declared on the models with the ones in the live database.
+    Returns a list of human readable problems, empty when both match.
+    """
+    declared = declared_indexes()
+    live = live_indexes(engine)
+    problems = []
+    for key, columns in declared.items():
+        if key not in live:
+            problems.append("missing index {} on {} {}".format(key[1], key[0], columns))
+        elif live[key] != columns:
+            problems.append("index {} on {} has columns {}, expected {}".format(key[1], key[0], live[key], columns))
+    for key, columns in live.items():
+        if key[1] and key[1].startswith('ix_') and key not in declared and key[1] not in UNDECLARED_INDEXES:
+            problems.append("undeclared index {} on {} {}".format(key[1], key[0], columns))
+    return problems
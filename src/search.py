@@ -0,0 +1,54 @@
+import re
+from sqlalchemy import or_, desc, func, literal_column, text
+from models import db, Question
+
+SEARCH_MIN_WORD_LENGTH = 3
+FULLTEXT_INDEX_NAME = 'ix_question_fulltext'
+# the fulltext migration indexes this expression and postgres_search queries it, keep them one string
+POSTGRES_TSVECTOR_SQL = "to_tsvector('simple'::regconfig, title || ' ' || description)"
+
+def tokenize(value):
+    # shared with the in-memory index, so the SQL and the BM25 search match the same words
+    return [token for token in re.findall(r'\w+', (value or '').lower())
+        if len(token) >= SEARCH_MIN_WORD_LENGTH]
+
+def like_search(query, words):
+    # plain ILIKE scan, used on dialects without a fulltext index (SQLite)
+    filters = []
+    for word in words:
+        word_like = "%{}%".format(word)
+        filters.append(Question.title.ilike(word_like))
+        filters.append(Question.description.ilike(word_like))
+    return query.filter(or_(*filters)).order_by(Question.created, Question.id)
+
+def postgres_search(query, words):
+    vector = literal_column(POSTGRES_TSVECTOR_SQL)
+    ts_query = func.to_tsquery(literal_column("'simple'::regconfig"),
+        ' | '.join(word + ':*' for word in words))
+    return query.filter(vector.op('@@')(ts_query)).order_by(
+        desc(func.ts_rank(vector, ts_query)), Question.id)
+
+def mysql_search(query, words):
+    match = text("MATCH (question.title, question.description) AGAINST (:search_terms IN BOOLEAN MODE)"
+        ).bindparams(search_terms=' '.join(word + '*' for word in words))
+    return query.filter(match).order_by(desc(match), Question.id)
+
+def search_questions(query, search_text, page=1, limit=50):
+    dialect = db.engine.dialect.name
+    words = tokenize(search_text)
+    # no word long enough to search for: nothing matches, whatever the dialect
+    if not words:
+        return [], None
+    if dialect == 'postgresql':
+        query = postgres_search(query, words)
+    elif dialect == 'mysql':
+        query = mysql_search(query, words)
+    else:
+        query = like_search(query, words)
+
+    rows = query.offset((page - 1) * limit).limit(limit + 1).all()
+    next_page = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_page = page + 1
+    return rows, next_page
@@ -0,0 +1,158 @@
+import os, sys, math, time, bisect, datetime, threading
+from array import array
+from models import db, Question
+from search import tokenize
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# rough per-term cost of the dict slot, the term string header and two empty arrays
+TERM_OVERHEAD_BYTES = 240
+DOC_OVERHEAD_BYTES = 160
+POSTING_BYTES = 8
+
+class QuestionSearchIndex():
+    """
+    In-memory inverted index over question titles and descriptions, scored with BM25.
+    Postings are kept as two parallel unsigned int arrays per term (doc ids, term frequencies),
+    sorted by doc id.
+    """
+    def __init__(self, enabled=False, max_bytes=64 * 1024 * 1024, sync_seconds=30, sync_lookback_seconds=60):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.sync_seconds = sync_seconds
+        self.sync_lookback_seconds = sync_lookback_seconds
+        self.lock = threading.RLock()
+        self.clear()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.environ.get('SEARCH_INDEX_ENABLED', 'false').lower() == 'true',
+            max_bytes=int(os.environ.get('SEARCH_INDEX_MAX_BYTES', 64 * 1024 * 1024)),
+            sync_seconds=int(os.environ.get('SEARCH_INDEX_SYNC_SECONDS', 30)),
+            sync_lookback_seconds=int(os.environ.get('SEARCH_INDEX_SYNC_LOOKBACK_SECONDS', 60))
+        )
+
+    def clear(self):
+        self.postings = {}
+        self.doc_lengths = {}
+        self.doc_terms = {}
+        self.total_length = 0
+        self.bytes_used = 0
+        self.built = False
+        self.over_limit = False
+        self.synced_until = None
+        self.synced_at = 0
+
+    @property
+    def usable(self):
+        return self.enabled and self.built and not self.over_limit
+
+    def build(self):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.clear()
+            self.built = True
+            self.sync()
+
+    def sync(self):
+        # each worker keeps its own index, so pick up writes made by the other workers.
+        # last_update is set before the commit, rows of a slow transaction can land behind the
+        # watermark: the rows of the last sync_lookback_seconds are read again.
+        # deletes leave no row to sync, the search endpoint removes the ids it no longer finds
+        query = db.session.query(Question.id, Question.title, Question.description, Question.last_update)
+        if self.synced_until is not None:
+            query = query.filter(Question.last_update >= self.synced_until
+                - datetime.timedelta(seconds=self.sync_lookback_seconds))
+        for id, title, description, last_update in query.yield_per(1000):
+            self.update_document(id, title, description)
+            if self.synced_until is None or last_update > self.synced_until:
+                self.synced_until = last_update
+            if self.over_limit:
+                break
+        self.synced_at = time.time()
+
+    def add(self, question):
+        if self.usable:
+            self.update_document(question.id, question.title, question.description)
+
+    def update(self, question):
+        self.add(question)
+
+    def remove(self, id):
+        if self.usable:
+            with self.lock:
+                self.remove_document(id)
+
+    def update_document(self, id, title, description):
+        with self.lock:
+            self.remove_document(id)
+            frequencies = {}
+            for token in tokenize(title) + tokenize(description):
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for term, frequency in frequencies.items():
+                term_postings = self.postings.get(term)
+                if term_postings is None:
+                    term_postings = (array('I'), array('I'))
+                    self.postings[term] = term_postings
+                    self.bytes_used += TERM_OVERHEAD_BYTES + sys.getsizeof(term)
+                ids, term_frequencies = term_postings
+                if not ids or ids[-1] < id:
+                    ids.append(id)
+                    term_frequencies.append(frequency)
+                else:
+                    # an older question edited again
+                    position = bisect.bisect_left(ids, id)
+                    ids.insert(position, id)
+                    term_frequencies.insert(position, frequency)
+            length = sum(frequencies.values())
+            terms = tuple(frequencies)
+            self.doc_lengths[id] = length
+            self.doc_terms[id] = terms
+            self.total_length += length
+            self.bytes_used += DOC_OVERHEAD_BYTES + sys.getsizeof(terms) + POSTING_BYTES * len(terms)
+            if self.bytes_used > self.max_bytes:
+                print("Search index over its memory ceiling, falling back to SQL search")
+                self.clear()
+                self.over_limit = True
+
+    def remove_document(self, id):
+        terms = self.doc_terms.pop(id, None)
+        if terms is None:
+            return
+        for term in terms:
+            ids, frequencies = self.postings[term]
+            position = bisect.bisect_left(ids, id)
+            del ids[position]
+            del frequencies[position]
+            if not ids:
+                del self.postings[term]
+                self.bytes_used -= TERM_OVERHEAD_BYTES + sys.getsizeof(term)
+        self.total_length -= self.doc_lengths.pop(id)
+        self.bytes_used -= DOC_OVERHEAD_BYTES + sys.getsizeof(terms) + POSTING_BYTES * len(terms)
+
+    def search(self, search_text, page=1, limit=50):
+        with self.lock:
+            if time.time() - self.synced_at > self.sync_seconds:
+                self.sync()
+            number_of_docs = len(self.doc_lengths)
+            if number_of_docs == 0:
+                return [], None
+            average_length = self.total_length / number_of_docs
+            scores = {}
+            for term in set(tokenize(search_text)):
+                term_postings = self.postings.get(term)
+                if term_postings is None:
+                    continue
+                ids, frequencies = term_postings
+                idf = math.log(1 + (number_of_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+                for id, frequency in zip(ids, frequencies):
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[id] / average_length)
+                    scores[id] = scores.get(id, 0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        ranked = sorted(scores, key=lambda id: (-scores[id], id))
+        start = (page - 1) * limit
+        next_page = page + 1 if len(ranked) > start + limit else None
+        return ranked[start:start + limit], next_page
+
+question_index = QuestionSearchIndex.from_env()
@@ -0,0 +1,42 @@
+import os, json
+from models import db, QuestionImages, AnswerImages
+from aws import s3_key, delete_s3_objects
+
+# image objects are stored once per content hash and shared by every row with that hash
+
+def find_stored_image(content_hash):
+    for model in (QuestionImages, AnswerImages):
+        image = model.query.filter(model.content_hash == content_hash).first()
+        if image is not None:
+            return image
+    return None
+
+def image_references(content_hash):
+    return sum(model.query.filter(model.content_hash == content_hash).count()
+        for model in (QuestionImages, AnswerImages))
+
+def url_references(url):
+    return sum(model.query.filter(model.url == url).count() for model in (QuestionImages, AnswerImages))
+
+def stored_images(model, *filters):
+    """
+    (content_hash, url, variants) of the content addressed rows matching filters,
+    read before the rows are deleted so their objects can be released afterwards.
+    """
+    return [tuple(image) for image in db.session.query(model.content_hash, model.url, model.variants).filter(
+        model.content_hash.isnot(None), *filters).all()]
+
+def release_stored_images(images):
+    # call after the delete is committed: objects no row references anymore are removed from S3
+    bucket_name = os.environ.get('S3_BUCKET_NAME')
+    keys = []
+    for content_hash, url, variants in set(images):
+        if image_references(content_hash) > 0:
+            continue
+        urls = [url] + [variant["url"] for variant in json.loads(variants or "{}").values()]
+        keys += [key for key in map(lambda x: s3_key(bucket_name, x), urls) if key]
+    try:
+        delete_s3_objects(bucket_name, keys)
+    except Exception as e:
+        print("Something Happened: ", e)
+    return keys
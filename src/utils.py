@@ -1,4 +1,6 @@
-from flask import jsonify, url_for
+import base64, datetime
+from flask import jsonify, url_for, request
+from sqlalchemy import and_, or_
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +17,51 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 200
+
+def encode_cursor(created, id):
+    raw = "{}|{}".format(created.isoformat(), id)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created, id = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(created), int(id)
+    except (ValueError, UnicodeError):
+        raise APIException('Invalid cursor', status_code=400)
+
+def page_args():
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', DEFAULT_PAGE_LIMIT, type=int)
+    return cursor, max(1, min(limit, MAX_PAGE_LIMIT))
+
+def page_query(query, model, cursor=None, limit=DEFAULT_PAGE_LIMIT):
+    # keyset pagination on (created, id): every page is an indexed range read of limit + 1 rows
+    if cursor:
+        created, id = decode_cursor(cursor)
+        query = query.filter(or_(model.created > created,
+            and_(model.created == created, model.id > id)))
+    return query.order_by(model.created, model.id).limit(limit + 1)
+
+def paginate(query, model, cursor=None, limit=DEFAULT_PAGE_LIMIT):
+    rows = page_query(query, model, cursor, limit).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if isinstance(last, tuple) and not hasattr(last, "created"):
+            # (model, extra columns...) rows, column projections carry created and id themselves
+            last = last[0]
+        next_cursor = encode_cursor(last.created, last.id)
+    return rows, next_cursor
+
+def page_headers(next_cursor):
+    if next_cursor is None:
+        return {}
+    return {"X-Next-Cursor": next_cursor}
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
@@ -0,0 +1,81 @@
+"""
+The counter columns kept by the write endpoints (answer_count, image_count, last_answer_at)
+against what `flask recount` rebuilds from the answer and image tables.
+"""
+import datetime
+from conftest import ANSWERS_PER_QUESTION
+
+def counters(*ids):
+    from models import db, Question
+    return {row.id: (row.answer_count, row.image_count, row.last_answer_at) for row in db.session.query(
+        Question.id, Question.answer_count, Question.image_count, Question.last_answer_at).filter(Question.id.in_(ids))}
+
+def assert_matches_recount(app, *ids):
+    from queries import recount_questions
+    with app.app_context():
+        kept = counters(*ids)
+        recount_questions()
+        assert counters(*ids) == kept
+    return kept
+
+def recounted(app, *ids):
+    # the seed leaves last_answer_at unset, start from the recounted values
+    from queries import recount_questions
+    with app.app_context():
+        recount_questions()
+        return counters(*ids)
+
+def add_answer(id_question, created):
+    from models import db, Answer
+    from queries import count_answer_added
+    answer = Answer(id_question=id_question, id_user=1, description="late answer", created=created, last_update=created)
+    db.session.add(answer)
+    count_answer_added(id_question, created)
+    db.session.commit()
+    return answer.id
+
+def test_add_answer(app, client, auth_headers):
+    recounted(app)
+    response = client.post('/answer', headers=auth_headers,
+        json={"id_question": 4, "id_user": 2, "description": "new answer", "link": ""})
+    assert response.status_code == 200
+    answer = response.get_json()["answer"]
+    answer_count, image_count, last_answer_at = assert_matches_recount(app, 4)[4]
+    assert (answer_count, image_count) == (ANSWERS_PER_QUESTION + 1, 1)
+    assert last_answer_at is not None
+    assert client.delete('/answer/{}'.format(answer["id"]), headers=auth_headers).status_code == 200
+
+def test_delete_answer(app, client, auth_headers):
+    before = recounted(app, 5)[5]
+    with app.app_context():
+        id = add_answer(5, datetime.datetime.now() + datetime.timedelta(days=1))
+    response = client.delete('/answer/{}'.format(id), headers=auth_headers)
+    assert response.status_code == 200
+    # last_answer_at goes back to the newest remaining answer
+    assert assert_matches_recount(app, 5)[5] == before
+
+def test_delete_question_cascade(app, client, auth_headers):
+    from models import db, Question, Answer, QuestionImages
+    from queries import count_question_images
+    now = datetime.datetime.now()
+    with app.app_context():
+        db.session.add(Question(id=2001, id_user=1, title="doomed question", description="to delete",
+            created=now, last_update=now))
+        db.session.add(QuestionImages(id_question=2001, url="https://test.invalid/doomed.png", size=1,
+            created=now, last_update=now))
+        db.session.flush()
+        count_question_images(2001, 1)
+        db.session.commit()
+        add_answer(2001, now)
+        add_answer(2001, now + datetime.timedelta(seconds=1))
+    recounted(app)
+    siblings = assert_matches_recount(app, 2001, 6)
+    assert siblings[2001][:2] == (2, 1)
+    response = client.delete('/question/2001', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json()["deleted"]["answers"] == 2
+    with app.app_context():
+        assert Answer.query.filter(Answer.id_question == 2001).count() == 0
+        assert QuestionImages.query.filter(QuestionImages.id_question == 2001).count() == 0
+    after = assert_matches_recount(app, 2001, 6)
+    assert after == {6: siblings[6]}
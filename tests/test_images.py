@@ -0,0 +1,71 @@
+import datetime, hashlib
+import pytest
+
+BUCKET = "test-bucket"
+
+@pytest.fixture
+def bucket(monkeypatch):
+    """
+    The S3 calls of main against a dict of key: bytes.
+    """
+    import main
+    objects = {}
+    monkeypatch.setenv("S3_BUCKET_NAME", BUCKET)
+    monkeypatch.setattr(main, "download_s3_object", lambda bucket_name, key: objects[key])
+    monkeypatch.setattr(main, "delete_s3_object", lambda bucket_name, key: objects.pop(key, None))
+    monkeypatch.setattr(main, "head_s3_object", lambda bucket_name, key:
+        {"ContentLength": len(objects[key]), "ContentType": "image/png"} if key in objects else None)
+    monkeypatch.setattr(main, "upload_files_to_s3", lambda files, bucket_name, **kwargs:
+        [{"filename": file.filename, "url": main.s3_location(bucket_name) + file.filename} for file in files])
+    return objects
+
+def add_image(id_question, url, content_hash=None):
+    from models import db, QuestionImages
+    from queries import count_question_images
+    now = datetime.datetime.now()
+    image = QuestionImages(id_question=id_question, url=url, size=1, content_hash=content_hash,
+        created=now, last_update=now)
+    db.session.add(image)
+    count_question_images(id_question, 1)
+    db.session.commit()
+    return image.id
+
+def remove_images(id_question, url):
+    from models import db, QuestionImages
+    from queries import count_question_images
+    removed = QuestionImages.query.filter(QuestionImages.id_question == id_question,
+        QuestionImages.url == url).delete(synchronize_session=False)
+    count_question_images(id_question, -removed)
+    db.session.commit()
+
+def test_variants_job_keeps_an_object_its_match_still_uses(app, bucket):
+    import main
+    key = "questions/2/retried/image.png"
+    bucket[key] = b"image bytes"
+    url = main.s3_location(BUCKET) + key
+    with app.app_context():
+        # the first row already went through the job, the second points at the same object
+        add_image(2, url, hashlib.sha256(b"image bytes").hexdigest())
+        second = add_image(2, url)
+        main.image_variants_task({"target": "question", "id": second, "key": key})
+        assert key in bucket
+        remove_images(2, url)
+
+def test_complete_presigned_upload_twice_adds_one_image(app, client, auth_headers, bucket):
+    from models import Question, QuestionImages, Job
+    key = "questions/3/completed-twice/image.png"
+    bucket[key] = b"other image bytes"
+    body = {"target": "question", "id": 3, "key": key}
+    with app.app_context():
+        jobs = Job.query.count()
+        image_count = Question.query.get(3).image_count
+    first = client.post('/presigned-image-upload/complete', json=body, headers=auth_headers)
+    second = client.post('/presigned-image-upload/complete', json=body, headers=auth_headers)
+    assert first.status_code == second.status_code == 200
+    assert first.get_json()["image"]["id"] == second.get_json()["image"]["id"]
+    with app.app_context():
+        url = QuestionImages.query.get(first.get_json()["image"]["id"]).url
+        assert QuestionImages.query.filter(QuestionImages.url == url).count() == 1
+        assert Question.query.get(3).image_count == image_count + 1
+        assert Job.query.count() == jobs + 1
+        remove_images(3, url)
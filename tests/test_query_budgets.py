@@ -0,0 +1,53 @@
+"""
+Every endpoint of ENDPOINT_QUERY_BUDGETS against rows with several answers and images each,
+a per row query (N+1 loop) goes over the budget and fails the test.
+"""
+import pytest
+from conftest import QUESTIONS
+from query_guard import QueryGuard, QueryBudgetExceeded
+
+def test_budgets_are_covered(query_budgets):
+    tested = {"get_questions", "get_question", "get_thread", "get_search_questions_by_string",
+        "get_answers", "answers_by_question_id", "get_roles", "login"}
+    assert set(query_budgets) == tested
+
+def test_get_questions(client, auth_headers, query_budgets):
+    response = client.get('/questions', headers=auth_headers)
+    assert response.status_code == 200
+    assert len(response.get_json()) == QUESTIONS
+
+def test_get_question(client, auth_headers, query_budgets):
+    assert client.get('/question/1', headers=auth_headers).status_code == 200
+
+def test_get_thread(client, auth_headers, query_budgets):
+    response = client.get('/thread/1', headers=auth_headers)
+    assert response.status_code == 200
+    assert all(answer["images"] for answer in response.get_json()["answers"])
+
+def test_get_search_questions_by_string(client, auth_headers, query_budgets):
+    response = client.get('/search-questions-by-string/python', headers=auth_headers)
+    assert response.status_code == 200
+    assert len(response.get_json()["questions"]) == QUESTIONS
+
+def test_get_answers(client, auth_headers, query_budgets):
+    assert client.get('/answers', headers=auth_headers).status_code == 200
+
+def test_answers_by_question_id(client, auth_headers, query_budgets):
+    response = client.get('/answers-by-question-id/1', headers=auth_headers)
+    assert response.status_code == 200
+    assert all(answer["user_name"] for answer in response.get_json())
+
+def test_get_roles(client, auth_headers, query_budgets):
+    assert client.get('/roles', headers=auth_headers).status_code == 200
+
+def test_login(client, query_budgets):
+    response = client.post('/login', json={"email": "user1@test.local", "password": "test"})
+    assert response.status_code == 200
+
+def test_over_budget_reports_repeated_statements(app, query_budgets):
+    from models import Question
+    with pytest.raises(QueryBudgetExceeded) as error:
+        with app.app_context(), QueryGuard(budget=2, name="loop"):
+            for question in Question.query.all():
+                question.user.name
+    assert "x SELECT" in str(error.value)
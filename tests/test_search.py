@@ -0,0 +1,72 @@
+def test_search_without_searchable_words_matches_nothing(client, auth_headers):
+    # words under SEARCH_MIN_WORD_LENGTH are ignored on every dialect
+    response = client.get('/search-questions-by-string/py fl', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json()["questions"] == []
+    assert response.get_json()["next_page"] is None
+
+def test_search_ignores_punctuation(client, auth_headers):
+    response = client.get('/search-questions-by-string/python!', headers=auth_headers)
+    assert len(response.get_json()["questions"]) > 0
+
+def add_question(id, title, last_update):
+    from models import db, Question
+    db.session.add(Question(id=id, id_user=1, title=title, description="", created=last_update,
+        last_update=last_update))
+    db.session.commit()
+
+def delete_question(id):
+    # straight to the table, like a delete made by another worker
+    from models import db, Question
+    Question.query.filter(Question.id == id).delete(synchronize_session=False)
+    db.session.commit()
+
+def test_index_drops_questions_deleted_by_other_workers(app, client, auth_headers, monkeypatch):
+    import datetime, main
+    from search_index import QuestionSearchIndex
+    index = QuestionSearchIndex(enabled=True)
+    monkeypatch.setattr(main, "question_index", index)
+    with app.app_context():
+        add_question(1001, "zebra one", datetime.datetime.now())
+        add_question(1002, "zebra two", datetime.datetime.now())
+        index.build()
+        delete_question(1001)
+    response = client.get('/search-questions-by-string/zebra?limit=1', headers=auth_headers)
+    assert [x["id"] for x in response.get_json()["questions"]] == [1002]
+    assert response.get_json()["next_page"] is None
+    assert 1001 not in index.doc_lengths
+    with app.app_context():
+        delete_question(1002)
+    response = client.get('/search-questions-by-string/zebra', headers=auth_headers)
+    assert response.get_json()["questions"] == []
+    assert 1002 not in index.doc_lengths
+
+def test_index_sync_reads_rows_committed_behind_the_watermark(app):
+    import datetime
+    from search_index import QuestionSearchIndex
+    index = QuestionSearchIndex(enabled=True)
+    with app.app_context():
+        index.build()
+        # last_update set before a slow commit, older than rows already synced
+        add_question(1003, "walrus", index.synced_until - datetime.timedelta(seconds=10))
+        index.synced_at = 0
+        assert index.search("walrus") == ([1003], None)
+        delete_question(1003)
+
+def test_index_postings_stay_sorted_and_bytes_balance():
+    from search_index import QuestionSearchIndex
+    index = QuestionSearchIndex(enabled=True)
+    for id in (1, 2, 3):
+        index.update_document(id, "otter", "river otter")
+    index.update_document(2, "otter", "sea otter")
+    assert list(index.postings["otter"][0]) == [1, 2, 3]
+    assert list(index.postings["otter"][1]) == [2, 2, 2]
+    for id in (2, 1, 3):
+        index.remove_document(id)
+    assert index.postings == {} and index.bytes_used == 0
+
+def test_sql_and_index_search_split_words_the_same_way(app, client, auth_headers):
+    from search import tokenize
+    assert tokenize("python,flask") == ["python", "flask"]
+    response = client.get('/search-questions-by-string/python,nothing', headers=auth_headers)
+    assert len(response.get_json()["questions"]) > 0